@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import sys
+from argparse import ArgumentParser
+from unitypack.catalog import Catalog
+
+def build(args):
+	catalog = Catalog(args.database)
+	updated = catalog.update(args.path)
+	for relpath in updated:
+		print('* indexed', relpath)
+	print('{} asset bundles (re)indexed'.format(len(updated)))
+
+def objects(args):
+	catalog = Catalog(args.database)
+	for row in catalog.find_objects(type=args.type, name=args.name, min_size=args.min_size, bundle=args.bundle):
+		print('{}\t{}\t{}\t{}\t{}'.format(row['bundle'], row['path_id'], row['type'], row['size'], row['name'] or ''))
+
+def container(args):
+	catalog = Catalog(args.database)
+	for row in catalog.find_container(args.pattern):
+		print('{}\t{}\t{}\t{}\t{}'.format(row['bundle'], row['path_id'], row['file_id'], row['type'] or '', row['path']))
+
+def main():
+	p = ArgumentParser(description='Build and query a catalog of every object in a cache directory')
+	sub = p.add_subparsers(dest='command', required=True)
+
+	b = sub.add_parser('build', help='Index new and changed asset bundles')
+	b.add_argument('database')
+	b.add_argument('path', help='Cache directory')
+	b.set_defaults(func=build)
+
+	o = sub.add_parser('objects', help='Find objects (patterns use SQL LIKE syntax)')
+	o.add_argument('database')
+	o.add_argument('--type', help='Exact type name, eg. Texture2D')
+	o.add_argument('--name', help='Object name pattern')
+	o.add_argument('--min-size', type=int, help='Minimum object size in bytes')
+	o.add_argument('--bundle', help='Asset bundle path pattern')
+	o.set_defaults(func=objects)
+
+	c = sub.add_parser('container', help='Find AssetBundle container entries (SQL LIKE pattern)')
+	c.add_argument('database')
+	c.add_argument('pattern')
+	c.set_defaults(func=container)
+
+	args = p.parse_args(sys.argv[1:])
+	args.func(args)
+
+if __name__ == '__main__':
+	main()
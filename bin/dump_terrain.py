@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import sys
+import numpy as np
 from unitypack.asset import Asset
 from PIL import Image
 
@@ -17,17 +18,19 @@ def main(filename, outpath):
 			indx = k
 			break
 
-	terrainData = tabledata.objects[indx].read()
+	terrainData = tabledata.objects[indx].read(numpy=True)
 	ofs = terrainData['m_Heightmap'].getmemboffset('m_Heights')
 	print('TerrainData object index is {}, offset in binary is {}'.format(indx, hex(ofs)))
 
-	pixels = []
-	for height in terrainData['m_Heightmap']['m_Heights']:
-		pix = int((height * 255) / MAX_HEIGHT)
-		pixels.append((pix, pix, pix))
+	width = terrainData['m_Heightmap']['m_Width']
+	height = terrainData['m_Heightmap']['m_Height']
+	heights = terrainData['m_Heightmap']['m_Heights']
 
-	img = Image.new("RGB", (terrainData['m_Heightmap']['m_Width'], terrainData['m_Heightmap']['m_Height']))
-	img.putdata(pixels)
+	# heights above MAX_HEIGHT (or below 0) saturate instead of wrapping around
+	pix = np.clip(heights * 255.0 / MAX_HEIGHT, 0, 255).astype(np.uint8)
+	pixels = np.repeat(pix[:width * height], 3).reshape(height, width, 3)
+
+	img = Image.fromarray(pixels, "RGB")
 	img.save(outpath)
 
 	print('done.')
@@ -11,19 +11,28 @@ import os
 import traceback
 import subprocess
 import argparse
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 from unitypack.asset import Asset
+from unitypack.catalog import find_asset_bundles
 from unitypack.export import OBJMesh
 from unitypack.environment import UnityEnvironment
+from unitypack.manifest import Manifest
 
 # from show_gameobject.py
 from collections import OrderedDict
 from unitypack.asset import Asset
 from unitypack.object import ObjectPointer
 from unitypack.engine.component import Transform
+from unitypack.engine.hierarchy import HierarchyWalker
 from unitypack.engine.object import GameObject
 
-environment = UnityEnvironment()
+# set up by init_environment()
+environment = None
+manifest = None
 
 def fixext(name):
 	tab = {'dds': 'png', 'nif': 'obj', 'kfm': 'obj', 'wav': 'ogg',
@@ -38,33 +47,37 @@ def fixext(name):
 
 	return name
 
-def write_to_file(path, contents, mode="w"):
-	#print('would have written to', path)
-	#return
+class Extraction:
+	"The objects an output is made from and the files written for it, for the manifest"
 
-	if os.path.exists(path):
-		#print('*** WARNING: {} already exists; skipping...'.format(path))
-		return
+	def __init__(self, outdir):
+		self.outdir = outdir
+		self.sources = []
+		self.outputs = []
 
-	with open(path, mode) as f:
-		written = f.write(contents)
+	def use(self, obj):
+		if obj not in self.sources:
+			self.sources.append(obj)
 
-	#print("Wrote %i bytes to %r" % (written, path))
+	def write(self, path, contents, mode='w'):
+		with open(path, mode) as f:
+			f.write(contents)
+		self.outputs.append(os.path.relpath(path, self.outdir))
 
-def handle_texture(d, outpath):
+def handle_texture(d, outpath, ex):
 	try:
 		from PIL import ImageOps
 	except ImportError:
-		print("WARNING: Pillow not available. Skipping %r." % (filename))
+		print("WARNING: Pillow not available. Skipping %r." % (outpath))
 		return
 	try:
 		image = d.image
 	except NotImplementedError:
-		print("WARNING: Texture format not implemented. Skipping %r." % (filename))
+		print("WARNING: Texture format not implemented. Skipping %r." % (outpath))
 		return
 
 	if image is None:
-		print("WARNING: %s is an empty image" % (filename))
+		print("WARNING: %s is an empty image" % (outpath))
 		return
 
 	# Texture2D objects are flipped
@@ -72,113 +85,56 @@ def handle_texture(d, outpath):
 	# PIL has no method to write to a string :/
 	output = BytesIO()
 	img.save(output, format="png")
-	write_to_file(outpath, output.getvalue(), mode="wb")
+	ex.write(outpath, output.getvalue(), mode="wb")
 
-def handle_material(d, outpath):
+def handle_material(d, outpath, ex):
 	texture_ref = d._obj['m_SavedProperties']['m_TexEnvs'][0][1]['m_Texture']
 	if texture_ref is not None:
-		handle_texture(texture_ref.resolve(), outpath)
+		texture = texture_ref.object
+		ex.use(texture)
+		handle_texture(texture.read(), outpath, ex)
 
-def handle_mesh(d, outpath):
+def handle_mesh(d, outpath, ex):
 	try:
 		mesh_data = OBJMesh(d).export()
-		write_to_file(outpath, mesh_data, mode="w")
+		ex.write(outpath, mesh_data, mode="w")
 	except NotImplementedError as e:
 		print("WARNING: Could not extract %r (%s)" % (d, e))
 
-class GameobjectSearch:
-	#seen = set()
-
-	def __init__(self):
-		self.seen = set()
-		self.meshes = []
-
-#def gameobject_recurse(obj, srch):
-#	if isinstance(obj, ObjectPointer) and obj.object not in srch.seen:
-#		#if obj.object.type == 'Mesh':
-#		#	srch.meshes.append(obj.resolve())
-#		if obj.object.type == 'SkinnedMeshRenderer':
-#			d = obj.resolve()
-#			srch.meshes.append(d['m_Mesh'].resolve())
-#			return
-#		elif obj.object.type == 'MeshFilter':
-#			d = obj.resolve()._obj
-#			srch.meshes.append(d['m_Mesh'].resolve())
-#			return
-#
-#		srch.seen.add(obj.object)
-#		gameobject_recurse(obj.resolve(), srch)
-
-def gameobject_recurse(obj, srch):
-	# NOTE: uncomment if re-enabling MeshFilter to...
-	# limit the number of meshes per object to 2 for now; to work around
-	# the problem of countless garbage meshes being ripped
-	#if len(srch.meshes) >= 2:
-	#	return
-
-	#print('recursing into', obj, 'type', type(obj))
-	if isinstance(obj, ObjectPointer) and obj.object not in srch.seen:
-		if obj.object.type == 'Mesh':
-			srch.meshes.append(obj.resolve())
-		if obj.object.type == 'SkinnedMeshRenderer':
-		#if obj.object.type.endswith('MeshRenderer'):
-			d = obj.resolve()
-			if d['m_Mesh'] is not None:
-				srch.meshes.append(d['m_Mesh'].resolve())
-			return
-		elif obj.object.type == 'MeshFilter':
-			#d = obj.resolve()._obj
-			#if d['m_Mesh'] is not None:
-			#	srch.meshes.append(d['m_Mesh'].resolve())
-			return
-
-		srch.seen.add(obj.object)
-		gameobject_recurse(obj.resolve(), srch)
-
-	#if not isinstance(obj, Transform) and not isinstance(obj, GameObject):
-	#	return
-
-	d = obj
-	if not isinstance(d, OrderedDict):
-		try:
-			d = obj._obj
-		except:
-			pass
-	if not isinstance(d, OrderedDict) and not isinstance(d, list) and not isinstance(d, tuple):
-		return
-
-	if type(d) == list:
-		for ent in d:
-			gameobject_recurse(ent, srch)
-	elif type(d) == tuple:
-		for ent in d:
-			gameobject_recurse(ent, srch)
-	else:
-		for k, v in d.items():
-			gameobject_recurse(v, srch)
-
-def handle_gameobject(obj, d, outpath):
-	srch = GameobjectSearch()
-
-	srch.seen.add(obj)
-	gameobject_recurse(d, srch)
-
-	if len(srch.meshes) == 0:
-		print('found {} meshes for {}'.format(len(srch.meshes), outpath))
+# Meshes are found by following GameObject components and Transform children
+# explicitly. MeshFilter meshes are left out and bone hierarchies pruned to
+# work around the problem of countless garbage meshes being ripped.
+# Its memo of the fields read from each object only lives as long as
+# the bundle being handled; see handle_bundle().
+walker = None
+
+def handle_gameobject(obj, d, outpath, ex):
+	root = walker.walk(obj, prune_bones=True)
+	# any change to the hierarchy changes one of these
+	for node in root:
+		ex.use(node.game_object)
+		for component in node.components:
+			ex.use(component)
+
+	meshes = walker.meshes(root, mesh_filters=False)
+	if len(meshes) == 0:
+		print('found {} meshes for {}'.format(len(meshes), outpath))
 		#sys.exit(1)
 
 	i = 0
-	for mesh in srch.meshes:
+	for mesh in meshes:
 		outname = outpath
-		if len(srch.meshes) != 1:
+		if len(meshes) != 1:
 			outname = outname.replace('.obj', ':{}.obj'.format(i))
 
-		handle_mesh(mesh, outname)
+		ex.use(mesh)
+		handle_mesh(mesh.read(), outname, ex)
 		i += 1
 
-def handle_object(obj, outpath):
+def handle_object(obj, outpath, ex):
 	#print('*** processing {} {}'.format(obj.type, outpath))
 	d = obj.read()
+	ex.use(obj)
 
 	# Expected types:
 	# 	AudioClip
@@ -196,35 +152,57 @@ def handle_object(obj, outpath):
 	# 	XdtTableScript -
 
 	if obj.type == "GameObject":
-		handle_gameobject(obj, d, outpath)
+		handle_gameobject(obj, d, outpath, ex)
 
 	elif obj.type == "Material":
-		handle_material(d, outpath)
+		handle_material(d, outpath, ex)
 
 	elif obj.type == "AudioClip":
-		write_to_file(outpath, d.audio_data, mode="wb")
+		ex.write(outpath, d.audio_data, mode="wb")
 
 	elif obj.type == "MovieTexture":
-		write_to_file(outpath, d.movie_data, mode="wb")
+		ex.write(outpath, d.movie_data, mode="wb")
 
 	elif obj.type == "Shader":
-		write_to_file(outpath, d.script)
+		ex.write(outpath, d.script)
 
 	elif obj.type == "Font":
-		write_to_file(outpath, d.data, mode="wb")
+		ex.write(outpath, d.data, mode="wb")
 
 	elif obj.type == "TextAsset":
-		write_to_file(outpath, d.script, mode=mode)
+		ex.write(outpath, d.script, mode=mode)
 
 	elif obj.type == "Texture2D":
-		handle_texture(d, outpath)
+		handle_texture(d, outpath, ex)
 
 	else:
 		print('*** unhandled type', obj.type)
 
-def handle_assetbundle(asset, outdir):
+def remove_outputs(outdir, entry):
+	"Delete what was extracted for a stale manifest entry, since the filenames may change"
+	for output in entry['outputs']:
+		try:
+			os.remove(os.path.join(outdir, output))
+		except FileNotFoundError:
+			pass
+
+def previous_owner(path, cas):
+	"The other bundle `path` was extracted from last time, if it still exists"
+	entry = manifest.entries.get(path)
+	if entry is not None and entry['bundle'] != cas and environment.find_file(entry['bundle']) is not None:
+		return entry['bundle']
+	return None
+
+def handle_assetbundle(cas, asset, outdir, owners, summary):
+	"""
+	Returns the manifest entries of everything extracted from (or still
+	current in) the bundle. Container paths that were extracted from
+	another bundle last time, or that `owners` maps to another bundle,
+	are left to that one.
+	"""
+	entries = {}
 	if asset.objects[1].type_id != 142:
-		return
+		return entries
 
 	cont = asset.objects[1].read()['m_Container']
 	for path, mtdt in cont:
@@ -233,54 +211,260 @@ def handle_assetbundle(asset, outdir):
 		outname = fixext(os.path.basename(path))
 		outpath = os.path.join(outdir, os.path.dirname(path), outname)
 
-		if os.path.exists(outpath):
-			print('** {} exists, skipping...'.format(outpath))
-			continue
-
-		#print('{} assetbundles open'.format(len(environment.files)))
 		try:
-			handle_object(mtdt['asset'].object, outpath)
+			obj = mtdt['asset'].object
+			entry = manifest.entries.get(path)
+
+			owner = previous_owner(path, cas) or owners.setdefault(path, cas)
+			if owner != cas:
+				print('** {} is extracted from {}, skipping...'.format(outpath, owner))
+				summary['skipped'] += 1
+				continue
+
+			if manifest.is_current(path, cas, obj, environment):
+				summary['unchanged'] += 1
+				entries[path] = entry
+				continue
+
+			if entry is not None:
+				print('** {} changed, extracting again...'.format(outpath))
+				remove_outputs(outdir, entry)
+
+			ex = Extraction(outdir)
+			handle_object(obj, outpath, ex)
+			entries[path] = manifest.make_entry(cas, obj, ex.sources, ex.outputs)
+			summary['handled'] += 1
 		except Exception as e:
 			if isinstance(e, KeyboardInterrupt):
 				raise e
 			print('** error while handling object {}'.format(outpath))
 			traceback.print_exc(file=sys.stdout)
+			summary['object errors'] += 1
 
-def main(path, outdir):
-	environment.base_path = path
+	return entries
 
-	files = os.listdir(path)
-	for ent in os.listdir(path):
-		abspath = os.path.join(path, ent)
-		if os.path.isdir(abspath):
-			files.remove(ent)
-			files.extend([os.path.join(ent, f) for f in os.listdir(abspath)])
+def init_environment(path, outdir):
+	"Each process has an environment (and a copy of the manifest) of its own"
+	global environment, manifest
 
-	for cas in files:
-		name = os.path.basename(cas).lower()
-		if not (name.startswith('customassetbundle') or name.startswith('buildplayer')):
-			continue
+	# keep hot objects (shared Materials, GameObjects, etc.) decoded, up to an estimated
+	# 128 MiB of memory per process; big Meshes and Textures don't fit and aren't kept
+	environment = UnityEnvironment(base_path=path, max_open_files=64, max_cached_bytes=128 * 1024 * 1024)
+
+	# what was extracted last time; only read here, the main process writes it
+	manifest = Manifest(outdir)
+	manifest.load()
 
-		# TODO: apply heuristics?
-		#if len(environment.files) > 64:
-		#	for f in environment.files[:32]:
-		#		f.close()
+def list_container(cas):
+	"""
+	(container path, bundle claiming it) pairs for each path in an asset
+	bundle, or None if it can't be read. Bundles claim their own paths,
+	except those previous_owner() keeps with another bundle.
+	"""
+	try:
+		asset = environment.get_asset_by_filename(cas)
+		if asset.objects[1].type_id != 142:
+			return []
+		cont = asset.objects[1].read_fields(['m_Container'])['m_Container']
+		return [(path, previous_owner(path, cas) or cas) for path, mtdt in cont]
+	except Exception as e:
+		if isinstance(e, KeyboardInterrupt):
+			raise e
+		print('* error while reading assetbundle {}'.format(cas))
+		traceback.print_exc(file=sys.stdout)
+		return None
+
+def handle_bundle(cas, outdir, owners):
+	"""
+	Extract a single asset bundle. `owners` maps container paths to the
+	bundle extracting them (see handle_assetbundle()). Returns a Counter
+	summarizing what happened, the object cache stats and the bundle's
+	manifest entries (None if the bundle couldn't be read at all).
+	"""
+	global walker
+
+	summary = Counter()
+	entries = None
+	walker = HierarchyWalker()
+
+	print('* opening', os.path.basename(cas).lower())
+	print('* {} assetbundles open'.format(environment.file_pool.num_open))
+	try:
+		asset = environment.get_asset_by_filename(cas)
+		entries = handle_assetbundle(cas, asset, outdir, owners, summary)
+		summary['bundles'] += 1
+	except Exception as e:
+		if isinstance(e, KeyboardInterrupt):
+			raise e
+		print('* error while handling assetbundle {}'.format(cas))
+		traceback.print_exc(file=sys.stdout)
+		summary['bundle errors'] += 1
+	finally:
+		walker = None
+
+	# the cache counts are running totals for the whole process
+	cache = environment.object_cache
+	return summary, (os.getpid(), cache.hits, cache.misses), entries
+
+def in_shard(cas, shard):
+	"Deterministically assign each bundle to one of n shards, by its relative path"
+	i, n = shard
+	return zlib.crc32(cas.replace(os.sep, '/').lower().encode('utf-8')) % n == i - 1
+
+def parse_shard(s):
+	try:
+		i, n = (int(x) for x in s.split('/'))
+	except ValueError:
+		raise argparse.ArgumentTypeError('expected i/n, eg. 1/4')
+	if not 1 <= i <= n:
+		raise argparse.ArgumentTypeError('shard must be between 1/{0} and {0}/{0}'.format(n))
+	return i, n
+
+def extract_parallel(path, outdir, jobs, files, merge, summary):
+	"""
+	Extract `files` in a pool of `jobs` worker processes. The container
+	paths of every bundle are listed first, so a path found in several
+	bundles is extracted from the first of them in `files`, just like
+	when extracting one bundle at a time.
+	"""
+	containers = {}
+
+	def listed(cas, claims):
+		if claims is None:
+			summary['bundle errors'] += 1
+		else:
+			containers[cas] = claims
+
+	if not run_in_pools(path, outdir, jobs, list_container, [(cas, ) for cas in files], listed, summary):
+		return
 
-		print('* opening', name)
-		print('* {} assetbundles open'.format(len(environment.files)))
+	owners = {}
+	for cas in files:
+		for p, claimant in containers.get(cas, ()):
+			owners.setdefault(p, claimant)
+
+	tasks = [(cas, outdir, {p: owners[p] for p, claimant in containers[cas]}) for cas in files if cas in containers]
+	run_in_pools(path, outdir, jobs, handle_bundle, tasks, merge, summary)
+
+def run_in_pools(path, outdir, jobs, fn, tasks, merge, summary):
+	"""
+	Call fn(*args) for each of `tasks` (argument tuples starting with the
+	bundle) in a pool of `jobs` worker processes, passing each bundle and
+	result to merge(). If a worker dies, the pool is replaced and the
+	bundles that were in flight are retried one at a time, so only the
+	one that kills its worker fails. Returns False if interrupted.
+	"""
+	queue = deque(tasks)
+	# in flight when a worker died
+	suspects = deque()
+
+	while queue or suspects:
+		if not run_in_pool(path, outdir, jobs, fn, queue, suspects, merge, summary):
+			return False
+	return True
+
+def run_in_pool(path, outdir, jobs, fn, queue, suspects, merge, summary):
+	"""
+	Run the tasks from `queue` (or `suspects`, one at a time) until they
+	run out or a worker dies. Returns False if interrupted.
+	"""
+	with ProcessPoolExecutor(jobs, initializer=init_environment, initargs=(path, outdir)) as pool:
+		pending = {}
 		try:
-			asset = environment.get_asset_by_filename(cas)
-			handle_assetbundle(asset, outdir)
+			while queue or suspects or pending:
+				# only a few bundles are queued ahead, so interrupting doesn't
+				# leave the whole cache waiting in the pool
+				while (suspects and not pending) or (queue and not suspects and len(pending) < jobs * 2):
+					source = suspects if suspects else queue
+					args = source.popleft()
+					try:
+						pending[pool.submit(fn, *args)] = args
+					except BrokenProcessPool:
+						source.appendleft(args)
+						break
+				if not pending:
+					# the pool broke while idle
+					break
+
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+				broken = []
+				for future in done:
+					args = pending.pop(future)
+					try:
+						merge(args[0], future.result())
+					except BrokenProcessPool:
+						broken.append(args)
+					except Exception:
+						print('* worker failed while handling assetbundle {}'.format(args[0]))
+						traceback.print_exc(file=sys.stdout)
+						summary['bundle errors'] += 1
+
+				if broken:
+					in_flight = broken + list(pending.values())
+					pending.clear()
+					if len(in_flight) == 1:
+						print('* worker died while handling assetbundle {}'.format(in_flight[0][0]))
+						summary['bundle errors'] += 1
+					else:
+						print('* a worker died, retrying {} asset bundles one at a time'.format(len(in_flight)))
+						suspects.extend(in_flight)
+					break
+		except KeyboardInterrupt:
+			pool.shutdown(wait=False, cancel_futures=True)
+			return False
+	return True
+
+def main(path, outdir, jobs=1, shard=None):
+	files = find_asset_bundles(path)
+	if shard is not None:
+		files = [cas for cas in files if in_shard(cas, shard)]
+		print('* shard {}/{}: {} asset bundles'.format(shard[0], shard[1], len(files)))
+
+	summary = Counter()
+	cache_stats = {}
+
+	manifest = Manifest(outdir)
+	manifest.load()
+
+	def merge(cas, ret):
+		result, (pid, hits, misses), entries = ret
+		cache_stats[pid] = (hits, misses)
+		summary.update(result)
+		if entries is not None:
+			manifest.update_bundle(cas, entries)
 
-		except Exception as e:
-			if isinstance(e, KeyboardInterrupt):
-				break
-			print('* error while handling assetbundle {}'.format(cas))
-			traceback.print_exc(file=sys.stdout)
+	try:
+		if jobs == 1:
+			init_environment(path, outdir)
+			# the first bundle to get to a container path extracts it
+			owners = {}
+			for cas in files:
+				try:
+					merge(cas, handle_bundle(cas, outdir, owners))
+				except KeyboardInterrupt:
+					break
+		else:
+			extract_parallel(path, outdir, jobs, files, merge, summary)
+	finally:
+		# whatever was extracted before an interruption or a crash is kept track of too
+		manifest.save()
+
+	print('* {} asset bundles extracted ({} errors)'.format(summary['bundles'], summary['bundle errors']))
+	print('* {} objects handled, {} unchanged, {} skipped, {} errors'.format(
+		summary['handled'], summary['unchanged'], summary['skipped'], summary['object errors']
+	))
+	hits = sum(h for h, m in cache_stats.values())
+	misses = sum(m for h, m in cache_stats.values())
+	print('* object cache: {} hits, {} misses'.format(hits, misses))
 
 
 if __name__ == '__main__':
-	if len(sys.argv) != 3:
-		print('usage: ffextract.py indir outdir')
-		sys.exit(1)
-	main(sys.argv[1], sys.argv[2])
+	p = argparse.ArgumentParser(description='Extract the assets of every asset bundle in a cache directory')
+	p.add_argument('indir', help='Cache directory (used as the base_path)')
+	p.add_argument('outdir')
+	p.add_argument('-j', '--jobs', type=int, default=1, help='Number of asset bundles to extract in parallel')
+	p.add_argument('--shard', type=parse_shard, metavar='i/n',
+		help='Only extract the i-th of n roughly equal parts of the asset bundles')
+	args = p.parse_args()
+
+	main(args.indir, args.outdir, max(args.jobs, 1), args.shard)
@@ -6,11 +6,9 @@ from unitypack.asset import Asset
 def main(f):
 	asset = Asset.from_file(f)
 
-	for id, obj in asset.objects.items():
-		name = ''
-		if hasattr(obj.read(), 'name'):
-			name = obj.read().name
-		print('{}\t{}\t{}\t{}'.format(id, obj.type_id, obj.type, name))
+	for obj in asset.iter_objects():
+		name = obj.read_fields(['m_Name']).get('m_Name', '')
+		print('{}\t{}\t{}\t{}'.format(obj.epath_id, obj.type_id, obj.type, name))
 
 if __name__ == '__main__':
 	with open(sys.argv[1], 'rb') as f:
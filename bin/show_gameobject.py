@@ -3,7 +3,6 @@
 import os
 import sys
 import colorsys
-from collections import OrderedDict
 
 from unitypack.asset import Asset
 from unitypack.object import ObjectPointer
@@ -27,45 +26,15 @@ def getcolor(t):
 
 	return '#{:02x}{:02x}{:02x}'.format(r, g, b)
 
-def find_pointers(d, oldkey):
-	# SubMeshes get their own class, so might as well handle those sitations
-	if hasattr(d, "_obj"):
-		d = d._obj
-
-	if isinstance(d, ObjectPointer):
-		return [(oldkey, d)]
-
-	# halt recursion if not a collection
-	if not isinstance(d, OrderedDict) and not isinstance(d, list) and not isinstance(d, tuple):
-		return []
-
-	ret = []
-	if isinstance(d, dict):
-		keys = d.keys()
-		d = d.values()
-
-		for key, ent in zip(keys, d):
-			ret.extend(find_pointers(ent, key))
-	else:
-		for n, ent in enumerate(d):
-			key = f'{oldkey}[{n}]'
-			ret.extend(find_pointers(ent, key))
-
-	return ret
-
-def handle_objbody(objbody, depth, parent_qid):
+def handle_object(obj, depth, parent_qid):
 	global meshes, textures, materials
 
-	d = objbody
-	if hasattr(d, "_obj"):
-		d = d._obj
-
-	pointers = find_pointers(d, '')
+	# only the pointers are read, the objects themselves aren't decoded
+	pointers = obj.get_pointers()
 
 	for key, ptr in pointers:
 		try:
 			info = ptr.object
-			body = ptr.resolve()
 		except:
 			print('could not resolve {}, skipping...'.format(ptr), file=sys.stderr)
 			continue
@@ -81,15 +50,13 @@ def handle_objbody(objbody, depth, parent_qid):
 		seen.append(qid)
 
 		# identify
-		name = ''
-		if hasattr(body, 'name'):
-			name = body.name
+		name = info.read_fields(['m_Name']).get('m_Name', '')
 		print(f'\t"{qid}" [label="{info.type} {ptr.file_id} {ptr.path_id}\n{name}", color="{getcolor(info.type)}"];', file=outf)
 
-		handle_objbody(body, depth + 1, qid)
+		handle_object(info, depth + 1, qid)
 
 		if info.type == 'Mesh':
-			meshes.append(body)
+			meshes.append(ptr.resolve())
 		elif info.type == 'Texture2D':
 			textures += 1
 		elif info.type == 'Material':
@@ -118,7 +85,7 @@ def main(f, name, base=None):
 			seen.append(qid)
 			print(f'\t"{qid}" [label="{gameobject.type} {0} {gameobject.path_id} {body.name}", color="{getcolor(gameobject.type)}"];', file=outf)
 
-			handle_objbody(body, 1, qid)
+			handle_object(gameobject, 1, qid)
 
                         # uncomment (and change path if on Windows) to auto-extract all encountered meshes
 			#i = 0
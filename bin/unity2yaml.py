@@ -9,9 +9,7 @@ from unitypack.object import ObjectPointer
 
 
 def handle_asset(asset):
-	for id, obj in asset.objects.items():
-		d = obj.read()
-
+	for obj, d in asset.iter_objects(decode=True):
 		print(yaml.dump(d))
 
 
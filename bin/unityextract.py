@@ -1,16 +1,113 @@
 #!/usr/bin/env python3
+import copy
 import os
 import pickle
 import sys
 import traceback
 import unitypack
 from argparse import ArgumentParser
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 from unitypack.asset import Asset
+from unitypack.engine.object import Object
 from unitypack.export import OBJMesh
+from unitypack.object import ObjectPointer
 from unitypack.utils import extract_audioclip_samples
 
 
+class Output:
+	"Where extracted files are written; it's passed to worker processes as is"
+
+	def __init__(self, outdir, dry_run=False):
+		self.outdir = outdir
+		self.dry_run = dry_run
+
+	def get_path(self, filename):
+		basedir = os.path.abspath(self.outdir)
+		path = os.path.join(basedir, filename)
+		dirs = os.path.dirname(path)
+		# may race with another worker
+		os.makedirs(dirs, exist_ok=True)
+		return path
+
+	def write(self, filename, contents, mode="w"):
+		path = self.get_path(filename)
+
+		if self.dry_run:
+			print("Would write %i bytes to %r" % (len(contents), path))
+			return
+
+		with open(path, mode) as f:
+			written = f.write(contents)
+
+		print("Wrote %i bytes to %r" % (written, path))
+
+
+def detach(value):
+	"""
+	A copy of a decoded value that can be sent to a worker process:
+	structs become dicts, memoryviews bytes, and the assets (and pointers
+	into them) are left out.
+	"""
+	if isinstance(value, Object):
+		ret = copy.copy(value)
+		# _obj, and whatever was cached on the object (eg. streamed data)
+		ret.__dict__ = {k: detach(v) for k, v in value.__dict__.items()}
+		return ret
+	if isinstance(value, (Asset, ObjectPointer)):
+		return None
+	if isinstance(value, Mapping):
+		return {k: detach(v) for k, v in value.items()}
+	if isinstance(value, list):
+		return [detach(v) for v in value]
+	if isinstance(value, tuple):
+		return tuple(detach(v) for v in value)
+	if isinstance(value, memoryview):
+		return bytes(value)
+	return value
+
+
+def convert_audioclip(output, d):
+	samples = extract_audioclip_samples(d)
+	for filename, sample in samples.items():
+		output.write(filename, sample, mode="wb")
+
+
+def convert_mesh(output, d):
+	try:
+		mesh_data = OBJMesh(d).export()
+		output.write(d.name + ".obj", mesh_data, mode="w")
+	except NotImplementedError as e:
+		print("WARNING: Could not extract %r (%s)" % (d, e))
+		#mesh_data = pickle.dumps(d._obj)
+		#output.write(d.name + ".Mesh.pickle", mesh_data, mode="wb")
+
+
+def convert_texture(output, d, filename):
+	from PIL import ImageOps
+
+	try:
+		image = d.image
+	except NotImplementedError:
+		print("WARNING: Texture format not implemented. Skipping %r." % (filename))
+		return
+
+	if image is None:
+		print("WARNING: %s is an empty image" % (filename))
+		return
+
+	print("Decoding %r" % (d))
+	# Texture2D objects are flipped
+	img = ImageOps.flip(image)
+	# PIL has no method to write to a string :/
+	png = BytesIO()
+	img.save(png, format="png")
+	output.write(filename, png.getvalue(), mode="wb")
+
+
 class UnityExtract:
 	FORMAT_ARGS = {
 		"audio": "AudioClip",
@@ -24,6 +121,9 @@ class UnityExtract:
 
 	def __init__(self, args):
 		self.parse_args(args)
+		self.output = Output(self.args.outdir, self.args.dry_run)
+		self.pool = None
+		self.pending = deque()
 
 	def parse_args(self, args):
 		p = ArgumentParser()
@@ -35,6 +135,7 @@ class UnityExtract:
 		p.add_argument("--as-asset", action="store_true", help="Force open files as Asset format")
 		p.add_argument("--filter", nargs="*", help="Filter extraction for a specific name")
 		p.add_argument("-n", "--dry-run", action="store_true", help="Skip writing files")
+		p.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes converting objects in parallel")
 		self.args = p.parse_args(args)
 
 		self.handle_formats = []
@@ -43,6 +144,18 @@ class UnityExtract:
 				self.handle_formats.append(classname)
 
 	def run(self):
+		if self.args.jobs > 1:
+			self.pool = ProcessPoolExecutor(self.args.jobs)
+
+		try:
+			self.extract_files()
+		finally:
+			if self.pool is not None:
+				self.pool.shutdown(cancel_futures=True)
+
+		return 0
+
+	def extract_files(self):
 		for file in self.args.files:
 			if self.args.as_asset or file.endswith(".assets"):
 				with open(file, "rb") as f:
@@ -59,49 +172,65 @@ class UnityExtract:
 				for asset in bundle.assets:
 					self.handle_asset(asset)
 
-		return 0
-
-	def get_output_path(self, filename):
-		basedir = os.path.abspath(self.args.outdir)
-		path = os.path.join(basedir, filename)
-		dirs = os.path.dirname(path)
-		if not os.path.exists(dirs):
-			os.makedirs(dirs)
-		return path
-
 	def write_to_file(self, filename, contents, mode="w"):
-		path = self.get_output_path(filename)
+		self.output.write(filename, contents, mode)
 
-		if self.args.dry_run:
-			print("Would write %i bytes to %r" % (len(contents), path))
+	def submit(self, id, func, *args):
+		"""
+		Run func(*args) in the worker processes, if there are any. Objects
+		are decoded in the main process, and detach()ed copies of them
+		passed to func, so func must only use what's passed to it.
+		At most twice as many conversions as there are workers are in flight
+		at a time, so decoded objects don't pile up waiting for a worker.
+		"""
+		if self.pool is None:
+			func(*args)
 			return
 
-		with open(path, mode) as f:
-			written = f.write(contents)
+		while len(self.pending) >= self.args.jobs * 2:
+			self.finish(*self.pending.popleft())
 
-		print("Wrote %i bytes to %r" % (written, path))
-		
-	def _handle_asset(self, asset, id, obj):
-		if obj.type not in self.handle_formats:
-			return
+		args = [detach(arg) for arg in args]
+		try:
+			future = self.pool.submit(func, *args)
+		except BrokenProcessPool:
+			# a worker died, failing what it was converting; carry on in a new pool
+			self.pool.shutdown(wait=False)
+			self.pool = ProcessPoolExecutor(self.args.jobs)
+			future = self.pool.submit(func, *args)
+		self.pending.append((id, future))
+
+	def finish(self, id, future):
+		try:
+			future.result()
+		except Exception as e:
+			print("ERROR WHILE DECODING {}:".format(id))
+			traceback.print_exception(type(e), e, e.__traceback__)
 
+	def drain(self):
+		while self.pending:
+			self.finish(*self.pending.popleft())
+
+	def _handle_asset(self, asset, id, obj):
 		def matches(name, filters):
 			for f in filters:
 				if f.lower() in name:
 					return True
 			return False
 
+		# check the name before decoding the whole object
+		if self.args.filter:
+			name = obj.read_fields(["m_Name"]).get("m_Name", "")
+			if not matches(name.lower(), self.args.filter):
+				return
+
 		d = obj.read()
-		if self.args.filter and not matches(d.name.lower(), self.args.filter):
-			return
 
 		if obj.type == "AudioClip":
 			if asset.format == 6 or asset.format == 7:
 				self.write_to_file(d.name + ".ogg", d.audio_data, mode="wb")
 			else:
-				samples = extract_audioclip_samples(d)
-				for filename, sample in samples.items():
-					self.write_to_file(filename, sample, mode="wb")
+				self.submit(id, convert_audioclip, self.output, d)
 
 		elif obj.type == "MovieTexture":
 			filename = d.name + ".ogv"
@@ -111,13 +240,7 @@ class UnityExtract:
 			self.write_to_file(d.name + ".cg", d.script)
 
 		elif obj.type == "Mesh":
-			try:
-				mesh_data = OBJMesh(d).export()
-				self.write_to_file(d.name + ".obj", mesh_data, mode="w")
-			except NotImplementedError as e:
-				print("WARNING: Could not extract %r (%s)" % (d, e))
-				#mesh_data = pickle.dumps(d._obj)
-				#self.write_to_file(d.name + ".Mesh.pickle", mesh_data, mode="wb")
+			self.submit(id, convert_mesh, self.output, d)
 
 		elif obj.type == "Font":
 			self.write_to_file(d.name + ".ttf", d.data, mode="wb")
@@ -139,26 +262,14 @@ class UnityExtract:
 			except ImportError:
 				print("WARNING: Pillow not available. Skipping %r." % (filename))
 				return
-			try:
-				image = d.image
-			except NotImplementedError:
-				print("WARNING: Texture format not implemented. Skipping %r." % (filename))
-				return
 
-			if image is None:
-				print("WARNING: %s is an empty image" % (filename))
-				return
-
-			print("Decoding %r" % (d))
-			# Texture2D objects are flipped
-			img = ImageOps.flip(image)
-			# PIL has no method to write to a string :/
-			output = BytesIO()
-			img.save(output, format="png")
-			self.write_to_file(filename, output.getvalue(), mode="wb")
+			# streamed image data is read from the asset here, not in the worker
+			d.image_data
+			self.submit(id, convert_texture, self.output, d, filename)
 
 	def handle_asset(self, asset):
-		for id, obj in asset.objects.items():
+		for obj in asset.iter_objects(types=self.handle_formats):
+			id = obj.epath_id
 			try:
 				self._handle_asset(asset, id, obj)
 			except Exception as e:
@@ -167,6 +278,9 @@ class UnityExtract:
 				print('ERROR WHILE DECODING {}:'.format(id))
 				traceback.print_exc()
 
+		# everything from this asset is written before moving on to the next
+		self.drain()
+
 def main():
 	app = UnityExtract(sys.argv[1:])
 	exit(app.run())
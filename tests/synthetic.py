@@ -0,0 +1,136 @@
+"""
+Helpers building small format 7 assets from hand-written TypeTrees.
+"""
+from unitypack.asset import Asset
+from unitypack.object import FFOrderedDict, ObjectInfo, ObjectPointer
+from unitypack.type import TypeTree
+
+
+PRIMITIVE_SIZES = {
+	"bool": 1, "SInt8": 1, "UInt8": 1, "char": 1, "SInt16": 2, "UInt16": 2,
+	"int": 4, "unsigned int": 4, "float": 4, "SInt64": 8, "UInt64": 8, "double": 8,
+}
+
+
+def node(type, name, children=(), align=False, is_array=False):
+	ret = TypeTree(7)
+	ret.type = type
+	ret.name = name
+	ret.children = list(children)
+	ret.is_array = is_array
+	ret.flags = 0x4000 if align else 0
+	if type in PRIMITIVE_SIZES:
+		ret.size = PRIMITIVE_SIZES[type]
+	elif is_array or any(child.size < 0 for child in ret.children):
+		ret.size = -1
+	else:
+		ret.size = sum(child.size for child in ret.children)
+	return ret
+
+
+def array(name, element, type="vector"):
+	return node(type, name, [node("Array", "Array", [node("int", "size"), element], is_array=True)])
+
+
+def string(name):
+	return node("string", name, [
+		node("Array", "Array", [node("int", "size"), node("char", "data")], is_array=True, align=True)
+	])
+
+
+def pptr(name, type="Object"):
+	return node("PPtr<%s>" % (type), name, [node("int", "m_FileID"), node("int", "m_PathID")])
+
+
+def game_object_tree():
+	return node("GameObject", "Base", [
+		array("m_Component", node("pair", "data", [node("int", "first"), pptr("second", "Component")])),
+		node("unsigned int", "m_Layer"),
+		string("m_Name"),
+		node("UInt16", "m_Tag"),
+		node("bool", "m_IsActive", align=True),
+	])
+
+
+def mono_behaviour_tree():
+	return node("MonoBehaviour", "Base", [
+		pptr("m_GameObject", "GameObject"),
+		node("UInt8", "m_Enabled", align=True),
+		pptr("m_Script", "MonoScript"),
+		string("m_Name"),
+		pptr("m_Target"),
+	])
+
+
+def asset_bundle_tree():
+	info = node("AssetInfo", "second", [node("int", "preloadIndex"), node("int", "preloadSize"), pptr("asset")])
+	return node("AssetBundle", "Base", [
+		string("m_Name"),
+		array("m_PreloadTable", pptr("data")),
+		array("m_Container", node("pair", "data", [string("first"), info]), type="map"),
+		node("AssetInfo", "m_MainAsset", info.children),
+	])
+
+
+def fields(**kwargs):
+	ret = FFOrderedDict()
+	ret.update(kwargs)
+	return ret
+
+
+def pointer(asset, path_id, file_id=0):
+	ret = ObjectPointer(None, asset)
+	ret.file_id = file_id
+	ret.path_id = path_id
+	return ret
+
+
+def new_asset(trees):
+	"An empty, loaded format 7 asset with the given type_id -> TypeTree dict"
+	ret = Asset()
+	ret.format = 7
+	ret.data_offset = 0
+	ret.long_object_ids = False
+	ret.loaded = True
+	ret.tree.type_trees.update(trees)
+	return ret
+
+
+def add(asset, path_id, type_id, contents):
+	obj = ObjectInfo(asset)
+	obj.path_id = path_id
+	obj.type_id = type_id
+	obj.class_id = type_id if type_id >= 0 else 114
+	obj.is_destroyed = False
+	obj._contents = contents
+	asset.register_object(obj)
+	return obj
+
+
+def game_object(asset, path_id, name):
+	return add(asset, path_id, 1, fields(m_Component=[], m_Layer=0, m_Name=name, m_Tag=0, m_IsActive=True))
+
+
+def mono_behaviour(asset, path_id, name, script=None, target=None, game_object=None):
+	return add(asset, path_id, -1, fields(
+		m_GameObject=game_object, m_Enabled=1, m_Script=script, m_Name=name, m_Target=target,
+	))
+
+
+def asset_bundle(asset, container):
+	"An AssetBundle object at path_id 1 listing {container path: path_id}"
+	return add(asset, 1, 142, fields(
+		m_Name="",
+		m_PreloadTable=[pointer(asset, path_id) for path_id in container.values()],
+		m_Container=[
+			(path, fields(preloadIndex=i, preloadSize=1, asset=pointer(asset, path_id)))
+			for i, (path, path_id) in enumerate(container.items())
+		],
+		m_MainAsset=fields(preloadIndex=0, preloadSize=0, asset=None),
+	))
+
+
+def save(asset, path):
+	with open(path, "wb") as f:
+		asset.save(f)
+	return path
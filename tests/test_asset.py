@@ -0,0 +1,33 @@
+from synthetic import game_object, game_object_tree, mono_behaviour, mono_behaviour_tree, new_asset, pointer, save
+from unitypack.asset import Asset
+from unitypack.environment import UnityEnvironment
+
+
+def test_iter_objects_unresolvable_script(tmp_path):
+	asset = new_asset({1: game_object_tree(), -1: mono_behaviour_tree()})
+	game_object(asset, 1, "go")
+	mono_behaviour(asset, 2, "broken", script=pointer(asset, 999))
+	game_object(asset, 3, "other")
+	path = save(asset, str(tmp_path / "broken.asset"))
+
+	with open(path, "rb") as f:
+		asset = Asset.from_file(f)
+		assert [obj.path_id for obj in asset.iter_objects(types="GameObject")] == [1, 3]
+		# without a script name, the MonoBehaviour goes by its TypeTree's
+		assert [obj.path_id for obj in asset.iter_objects(types=("GameObject", "MonoBehaviour"))] == [1, 2, 3]
+
+
+def test_path_id_owner_sees_added_objects():
+	environment = UnityEnvironment()
+	asset, other = new_asset({1: game_object_tree()}), new_asset({1: game_object_tree()})
+	asset.environment = other.environment = environment
+	asset.asset_refs.append(other)
+	game_object(asset, 1, "here")
+	game_object(other, 2, "there")
+	assert asset.get_path_id_owner(2) is other
+
+	# objects added after the index was built, to either asset
+	game_object(other, 3, "added there")
+	assert asset.get_path_id_owner(3) is other
+	game_object(asset, 4, "added here")
+	assert asset.get_path_id_owner(4) is asset
@@ -0,0 +1,28 @@
+from synthetic import game_object, game_object_tree, mono_behaviour, mono_behaviour_tree, new_asset, pointer, save
+from unitypack.asset import Asset
+
+
+def test_lazy_none_fields_decoded_once(tmp_path):
+	asset = new_asset({1: game_object_tree(), -1: mono_behaviour_tree()})
+	game_object(asset, 1, "go")
+	mono_behaviour(asset, 2, "mb", game_object=pointer(asset, 1))
+	path = save(asset, str(tmp_path / "lazy.asset"))
+
+	with open(path, "rb") as f:
+		obj = Asset.from_file(f).objects[2]
+		d = obj.read(lazy=True)
+		d = getattr(d, "_obj", d)
+
+		compiled = []
+		compile = d._compiler.compile
+		d._compiler.compile = lambda type: compiled.append(type.name) or compile(type)
+
+		# m_Script is a null pointer
+		assert d.decode("m_Script") is None
+		assert d.decode("m_Script") is None
+		assert d["m_Script"] is None
+		assert compiled == ["m_Script"]
+
+		# and a field set to None stays None
+		d["m_GameObject"] = None
+		assert d.decode("m_GameObject") is None
@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+from synthetic import asset_bundle, asset_bundle_tree, game_object, game_object_tree, new_asset, save
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin"))
+import ffextract  # noqa: E402
+
+
+def make_bundles(indir, count):
+	"Asset bundles that all contain assets/shared.prefab, and one path of their own"
+	for i in range(count):
+		asset = new_asset({1: game_object_tree(), 142: asset_bundle_tree()})
+		asset_bundle(asset, {"assets/shared.prefab": 2, "assets/own%d.prefab" % (i): 3})
+		game_object(asset, 2, "shared")
+		game_object(asset, 3, "own")
+		save(asset, os.path.join(indir, "CustomAssetBundle-%02d" % (i)))
+
+
+def extract(indir, outdir, jobs):
+	ffextract.main(str(indir), str(outdir), jobs)
+	with open(os.path.join(outdir, ".manifest.json")) as f:
+		return {path: entry["bundle"] for path, entry in json.load(f).items()}
+
+
+def test_duplicate_paths_parallel(tmp_path):
+	indir = tmp_path / "cache"
+	indir.mkdir()
+	make_bundles(str(indir), 8)
+
+	serial = extract(indir, tmp_path / "serial", 1)
+	assert serial["assets/shared.prefab"] == "CustomAssetBundle-00"
+	assert len(serial) == 9
+	for i in range(3):
+		assert extract(indir, tmp_path / ("parallel%d" % (i)), 3) == serial
+
+
+def test_duplicate_paths_previous_owner(tmp_path):
+	indir = tmp_path / "cache"
+	indir.mkdir()
+	make_bundles(str(indir), 4)
+
+	# a path extracted from a later bundle last time stays with that bundle
+	outdir = tmp_path / "out"
+	outdir.mkdir()
+	with open(os.path.join(outdir, ".manifest.json"), "w") as f:
+		json.dump({"assets/shared.prefab": {
+			"bundle": "CustomAssetBundle-02", "path_id": 2, "hash": "", "sources": [], "outputs": [],
+		}}, f)
+	assert extract(indir, outdir, 3)["assets/shared.prefab"] == "CustomAssetBundle-02"
@@ -0,0 +1,47 @@
+from synthetic import game_object, game_object_tree, mono_behaviour, mono_behaviour_tree, new_asset, pointer, save
+from unitypack.asset import Asset
+from unitypack.environment import UnityEnvironment
+
+
+def open_assets(tmp_path, long_object_ids):
+	"""
+	Two assets that both have a GameObject at path_id 1. A MonoBehaviour
+	in the first one points to its own GameObject 1, and to GameObject 3,
+	which only the second asset has.
+	"""
+	high = (7 << 32) if long_object_ids else 0
+
+	first = new_asset({1: game_object_tree(), -1: mono_behaviour_tree()})
+	first.long_object_ids = long_object_ids
+	game_object(first, high | 1, "first")
+	mono_behaviour(first, high | 2, "mb", game_object=pointer(first, 1), target=pointer(first, 3))
+	save(first, str(tmp_path / "first.asset"))
+
+	second = new_asset({1: game_object_tree()})
+	second.long_object_ids = long_object_ids
+	game_object(second, high | 1, "second")
+	game_object(second, high | 3, "target")
+	save(second, str(tmp_path / "second.asset"))
+
+	environment = UnityEnvironment(base_path=str(tmp_path))
+	first = Asset.from_file(open(str(tmp_path / "first.asset"), "rb"), environment=environment)
+	second = Asset.from_file(open(str(tmp_path / "second.asset"), "rb"), environment=environment)
+	first.asset_refs.append(second)
+	return first, second
+
+
+def check_referrers(first, second):
+	mb = first.objects[2]
+	assert first.references.referrers(first.objects[1]) == [mb]
+	assert first.references.referrers(second.objects[3]) == [mb]
+	# same path_id as the GameObject mb points to, but in the other asset
+	assert first.references.referrers(second.objects[1]) == []
+	assert first.references.dependencies(mb) == [first.objects[1], second.objects[3]]
+
+
+def test_referrers_across_assets(tmp_path):
+	check_referrers(*open_assets(tmp_path, False))
+
+
+def test_referrers_long_object_ids(tmp_path):
+	check_referrers(*open_assets(tmp_path, True))
@@ -1,14 +1,22 @@
 import os
+import heapq
 import logging
 import lzma
+import mmap
 from binascii import hexlify
 from io import BytesIO
 from uuid import UUID
+from .filepool import PooledFile
 from .object import ObjectInfo, ObjectPointer, FFOrderedDict
 from .type import TypeMetadata
 from .utils import BinaryReader, BinaryWriter
 
 
+def _data_offset(obj):
+	# objects added with add_object() aren't in the file yet; they go last
+	return getattr(obj, "data_offset", float("inf"))
+
+
 class Asset:
 	@classmethod
 	def from_bundle(cls, bundle, buf):
@@ -58,15 +66,30 @@ class Asset:
 		return ret
 
 	@classmethod
-	def from_file(cls, file, environment=None):
+	def from_file(cls, file, environment=None, use_mmap=False):
+		"""
+		Open an asset from a file object.
+		With use_mmap, the file is memory-mapped and objects are decoded
+		straight from the mapping. Byte arrays (image data, audio data etc.)
+		are then returned as zero-copy memoryviews instead of bytes.
+		`file` may be a PooledFile, in which case it's mapped (and reopened)
+		through its pool.
+		"""
 		ret = cls()
 		ret.name = file.name
+		ret.path = os.path.abspath(file.name)
 		ret._buf_ofs = file.tell()
 		ret._buf = BinaryReader(file)
+		if use_mmap:
+			if isinstance(file, PooledFile):
+				ret._pooled_file = file
+			else:
+				ret._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+				ret._mmap_view = memoryview(ret._mmap)
 		base_path = os.path.abspath(os.path.dirname(file.name))
 		if environment is None:
 			from .environment import UnityEnvironment
-			environment = UnityEnvironment(base_path=base_path)
+			environment = UnityEnvironment(base_path=base_path, use_mmap=use_mmap)
 		ret.environment = environment
 		return ret
 
@@ -77,35 +100,78 @@ class Asset:
 
 	def __init__(self):
 		self._buf_ofs = None
+		self._mmap = None
+		self._mmap_view = None
+		self._pooled_file = None
 		self._objects = {}
 		self.adds = []
 		self.asset_refs = [self]
 		self.types = {}
 		self.typenames = {}
 		self.bundle = None
+		self.environment = None
 		self.name = ""
+		self.path = None
 		self.long_object_ids = False
 		self.tree = TypeMetadata(self)
+		self.compilers = {}
+		self.decoders = {}
 		self.loaded = False
+		# file_id -> Asset table, path_id -> Asset index for format 7
+		# pointers and how many of asset_refs have been indexed so far.
+		# Valid for one generation of the environment.
+		self._ref_assets = []
+		self._path_id_index = {}
+		self._path_id_index_refs = 0
+		self._ref_generation = 0
+		self._references = None
+		# type_id -> objects of that type in data_offset order
+		self._type_index = None
 
 	def __repr__(self):
 		return "<%s %s>" % (self.__class__.__name__, self.name)
 
+	@property
+	def _view(self):
+		"memoryview of the whole file if it's memory-mapped, otherwise None"
+		if self._pooled_file is not None:
+			return self._pooled_file.view
+		return self._mmap_view
+
 	@property
 	def objects(self):
 		if not self.loaded:
 			self.load()
 		return self._objects
 
+	@property
+	def references(self):
+		"Forward and reverse pointer index of this asset's objects"
+		if self._references is None:
+			from .references import AssetReferences
+			self._references = AssetReferences.load(self)
+		return self._references
+
 	@property
 	def is_resource(self):
 		return self.name.endswith(".resource")
 
+	@property
+	def metadata_cache(self):
+		if self.path is None or self.environment is None:
+			return None
+		return self.environment.metadata_cache
+
 	def load(self):
 		if self.is_resource:
 			self.loaded = True
 			return
 
+		cache = self.metadata_cache
+		if cache is not None and cache.load(self):
+			self.loaded = True
+			return
+
 		buf = self._buf
 		buf.seek(self._buf_ofs)
 		buf.endian = ">"
@@ -154,6 +220,99 @@ class Asset:
 		assert not unk_string, repr(unk_string)
 		self.loaded = True
 
+		if cache is not None:
+			cache.store(self)
+
+	def _check_ref_generation(self):
+		generation = getattr(self.environment, "generation", 0)
+		if generation != self._ref_generation:
+			self._ref_assets = []
+			self._path_id_index = {}
+			self._path_id_index_refs = 0
+			self._ref_generation = generation
+
+	def get_ref_asset(self, file_id):
+		"The Asset file_id refers to. Each ref is only resolved once."
+		self._check_ref_generation()
+		table = self._ref_assets
+		if len(table) < len(self.asset_refs):
+			table.extend([None] * (len(self.asset_refs) - len(table)))
+
+		ret = table[file_id]
+		if ret is None:
+			ret = self.asset_refs[file_id]
+			if isinstance(ret, AssetRef):
+				ret = ret.resolve()
+			table[file_id] = ret
+		return ret
+
+	def get_path_id_owner(self, path_id):
+		"""
+		The first of asset_refs (starting with this asset itself) that has
+		an object with the given path_id. Format 7 pointers don't use
+		file_ids, so this is what they point to.
+		The refs are resolved and indexed as far as needed, once.
+		"""
+		self._check_ref_generation()
+		index = self._path_id_index
+		while path_id not in index:
+			if self._path_id_index_refs >= len(self.asset_refs):
+				raise KeyError("path_id {} not found in asset_refs".format(path_id))
+			asset = self.get_ref_asset(self._path_id_index_refs)
+			for key in asset.objects:
+				index.setdefault(key, asset)
+			self._path_id_index_refs += 1
+		return index[path_id]
+
+	def get_type_index(self):
+		"Maps each type_id to the objects of that type, in data_offset order"
+		if self._type_index is None:
+			index = {}
+			for obj in self.objects.values():
+				index.setdefault(obj.type_id, []).append(obj)
+			for objects in index.values():
+				objects.sort(key=_data_offset)
+			self._type_index = index
+		return self._type_index
+
+	def _type_name(self, obj):
+		try:
+			return str(obj.type)
+		except Exception as e:
+			# MonoBehaviours are named after their script, which may not resolve
+			logging.warning("Cannot get the type name of type_id %i (path_id %i): %s", obj.type_id, obj.path_id, e)
+			tree = self.tree.type_trees.get(obj.type_id)
+			return tree.type if tree is not None else None
+
+	def iter_objects(self, types=None, names=None, decode=False):
+		"""
+		Iterate over the objects of this asset in data_offset order (so the
+		file is read sequentially), optionally only those whose type name
+		is one of `types` and whose m_Name is one of `names` (either may be
+		a single string). Names are read without decoding the objects.
+		Yields ObjectInfos, or (ObjectInfo, decoded object) pairs if
+		`decode` is set. Nothing is kept decoded between iterations.
+		"""
+		if isinstance(types, str):
+			types = (types, )
+		if isinstance(names, str):
+			names = (names, )
+
+		index = self.get_type_index()
+		if types is None:
+			selected = list(index.values())
+		else:
+			# the type name is the same for all objects of a type_id
+			selected = [objects for objects in index.values() if self._type_name(objects[0]) in types]
+
+		for obj in heapq.merge(*selected, key=_data_offset):
+			if names is not None and obj.read_fields(["m_Name"]).get("m_Name") not in names:
+				continue
+			if decode:
+				yield obj, obj.read()
+			else:
+				yield obj
+
 	def read_id(self, buf):
 		if self.format >= 14:
 			return buf.read_int64()
@@ -175,6 +334,15 @@ class Asset:
 			raise ValueError("Duplicate asset object: %r (path_id=%r)" % (obj, obj.path_id))
 
 		self._objects[obj.epath_id] = obj
+		self._objects_changed()
+
+	def _objects_changed(self):
+		self._type_index = None
+		self._path_id_index = {}
+		self._path_id_index_refs = 0
+		if self.loaded and self.environment is not None:
+			# other assets may have indexed this one's path_ids too
+			self.environment.generation += 1
 
 	def pretty(self):
 		ret = []
@@ -254,6 +422,7 @@ class Asset:
 		obj.init()
 
 		self._objects[obj.path_id] = obj
+		self._objects_changed()
 
 		return obj
 
@@ -293,6 +462,8 @@ class Asset:
 class AssetRef:
 	def __init__(self, source):
 		self.source = source
+		self.asset = None
+		self._generation = 0
 
 	def __repr__(self):
 		return "<%s (asset_path=%r, guid=%r, type=%r, file_path=%r)>" % (
@@ -313,4 +484,9 @@ class AssetRef:
 		buf.write_string(self.file_path)
 
 	def resolve(self):
-		return self.source.get_asset(self.file_path)
+		"The referenced Asset. Memoized until the environment is reloaded."
+		generation = getattr(self.source.environment, "generation", 0)
+		if self.asset is None or self._generation != generation:
+			self.asset = self.source.get_asset(self.file_path)
+			self._generation = generation
+		return self.asset
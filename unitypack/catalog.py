@@ -0,0 +1,194 @@
+"""
+SQLite catalog of every object in a cache directory.
+
+Catalog.update() walks a directory of asset bundles (and its immediate
+subdirectories, like a FusionFall cache) and records every object and every
+AssetBundle m_Container entry. Files whose size and mtime haven't changed
+since the last update are skipped, so keeping a catalog current is cheap.
+"""
+import logging
+import os
+import sqlite3
+from .asset import Asset
+from .environment import UnityEnvironment
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bundles (
+	id INTEGER PRIMARY KEY,
+	path TEXT NOT NULL UNIQUE,
+	size INTEGER NOT NULL,
+	mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS objects (
+	bundle_id INTEGER NOT NULL REFERENCES bundles(id),
+	path_id INTEGER NOT NULL,
+	type_id INTEGER NOT NULL,
+	class_id INTEGER NOT NULL,
+	type TEXT NOT NULL,
+	name TEXT,
+	size INTEGER NOT NULL,
+	data_offset INTEGER NOT NULL,
+	PRIMARY KEY (bundle_id, path_id)
+);
+CREATE TABLE IF NOT EXISTS container (
+	bundle_id INTEGER NOT NULL REFERENCES bundles(id),
+	path TEXT NOT NULL,
+	file_id INTEGER NOT NULL,
+	path_id INTEGER NOT NULL,
+	preload_index INTEGER,
+	preload_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS objects_type ON objects (type, size);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (name);
+CREATE INDEX IF NOT EXISTS objects_size ON objects (size);
+CREATE INDEX IF NOT EXISTS container_path ON container (path);
+CREATE INDEX IF NOT EXISTS container_object ON container (bundle_id, path_id);
+"""
+
+
+def is_asset_bundle(filename):
+	name = os.path.basename(filename).lower()
+	return name.startswith("customassetbundle") or name.startswith("buildplayer")
+
+
+def find_asset_bundles(path):
+	"Relative paths of the asset bundles in `path` and its immediate subdirectories"
+	ret = []
+	for ent in sorted(os.listdir(path)):
+		abspath = os.path.join(path, ent)
+		if os.path.isdir(abspath):
+			ret.extend(os.path.join(ent, f) for f in sorted(os.listdir(abspath)) if is_asset_bundle(f))
+		elif is_asset_bundle(ent):
+			ret.append(ent)
+	return ret
+
+
+class Catalog:
+	def __init__(self, path):
+		self.path = path
+		self.db = sqlite3.connect(path)
+		self.db.row_factory = sqlite3.Row
+		self.db.executescript(SCHEMA)
+
+	def __repr__(self):
+		return "%s(%r)" % (self.__class__.__name__, self.path)
+
+	def close(self):
+		self.db.close()
+
+	def update(self, base_path, environment=None):
+		"""
+		Bring the catalog up to date with the asset bundles in `base_path`.
+		Returns the relative paths of the bundles that were (re)indexed.
+		"""
+		if environment is None:
+			environment = UnityEnvironment(base_path=base_path)
+
+		known = {row["path"]: row for row in self.db.execute("SELECT * FROM bundles")}
+		found = find_asset_bundles(base_path)
+		updated = []
+
+		for relpath in found:
+			st = os.stat(os.path.join(base_path, relpath))
+			row = known.get(relpath)
+			if row is not None and row["size"] == st.st_size and row["mtime"] == st.st_mtime_ns:
+				continue
+
+			if row is not None:
+				self.remove_bundle(row["id"])
+			try:
+				self.add_bundle(base_path, relpath, st, environment)
+			except Exception as e:
+				if isinstance(e, KeyboardInterrupt):
+					raise
+				logging.warning("Could not index %r (%s)", relpath, e)
+				self.db.rollback()
+				continue
+			self.db.commit()
+			updated.append(relpath)
+
+		for relpath in set(known) - set(found):
+			self.remove_bundle(known[relpath]["id"])
+		self.db.commit()
+
+		return updated
+
+	def remove_bundle(self, bundle_id):
+		self.db.execute("DELETE FROM objects WHERE bundle_id = ?", (bundle_id, ))
+		self.db.execute("DELETE FROM container WHERE bundle_id = ?", (bundle_id, ))
+		self.db.execute("DELETE FROM bundles WHERE id = ?", (bundle_id, ))
+
+	def add_bundle(self, base_path, relpath, st, environment):
+		with open(os.path.join(base_path, relpath), "rb") as f:
+			asset = Asset.from_file(f, environment=environment)
+
+			cur = self.db.execute(
+				"INSERT INTO bundles (path, size, mtime) VALUES (?, ?, ?)",
+				(relpath, st.st_size, st.st_mtime_ns)
+			)
+			bundle_id = cur.lastrowid
+
+			objects = []
+			for path_id, obj in asset.objects.items():
+				name = obj.read_fields(["m_Name"]).get("m_Name")
+				if not isinstance(name, str):
+					name = None
+				objects.append((
+					bundle_id, path_id, obj.type_id, obj.class_id, str(obj.type), name,
+					obj.size, obj.data_offset
+				))
+			self.db.executemany("INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", objects)
+
+			if 1 in asset.objects and asset.objects[1].type_id == 142:
+				container = asset.objects[1].read_fields(["m_Container"]).get("m_Container", [])
+				self.db.executemany("INSERT INTO container VALUES (?, ?, ?, ?, ?, ?)", [
+					(
+						bundle_id, path, mtdt["asset"].file_id if mtdt["asset"] else 0,
+						mtdt["asset"].path_id if mtdt["asset"] else 0,
+						mtdt["preloadIndex"], mtdt["preloadSize"]
+					)
+					for path, mtdt in container
+				])
+
+	def find_objects(self, type=None, name=None, min_size=None, bundle=None):
+		"""
+		Objects matching all of the given criteria. `name` and `bundle` are
+		SQL LIKE patterns. Rows have bundle, path_id, type_id, class_id, type,
+		name, size and data_offset columns.
+		"""
+		where, args = [], []
+		if type is not None:
+			where.append("o.type = ?")
+			args.append(type)
+		if name is not None:
+			where.append("o.name LIKE ?")
+			args.append(name)
+		if min_size is not None:
+			where.append("o.size >= ?")
+			args.append(min_size)
+		if bundle is not None:
+			where.append("b.path LIKE ?")
+			args.append(bundle)
+
+		query = "SELECT b.path AS bundle, o.* FROM objects o JOIN bundles b ON b.id = o.bundle_id"
+		if where:
+			query += " WHERE " + " AND ".join(where)
+		query += " ORDER BY b.path, o.path_id"
+		return self.db.execute(query, args).fetchall()
+
+	def find_container(self, path):
+		"""
+		AssetBundle m_Container entries whose path matches the SQL LIKE
+		pattern `path`, along with the type of the object they point to (for
+		objects in the same bundle). Rows have bundle, path, file_id, path_id,
+		preload_index, preload_size and type columns.
+		"""
+		return self.db.execute("""
+			SELECT b.path AS bundle, c.path, c.file_id, c.path_id, c.preload_index, c.preload_size, o.type
+			FROM container c
+			JOIN bundles b ON b.id = c.bundle_id
+			LEFT JOIN objects o ON c.file_id = 0 AND o.bundle_id = c.bundle_id AND o.path_id = c.path_id
+			WHERE c.path LIKE ?
+			ORDER BY b.path, c.path
+		""", (path, )).fetchall()
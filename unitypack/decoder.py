@@ -0,0 +1,611 @@
+"""
+Compiles TypeTrees into specialized decoder functions.
+
+ObjectInfo.read_value() walks the TypeTree and dispatches on type names for
+every single field it reads. The compiler here does that walk once per type
+and generates Python source for a function that only does the reading.
+The generated functions produce exactly what read_value() does, which
+remains available as the reference implementation.
+
+In numpy mode, arrays of primitives and of flat structs of primitives are
+instead returned as NumPy arrays (with a structured dtype for structs).
+
+For lazy decoding, the compiler also generates skip functions, which find
+the end of a value without decoding it; fixed-size values are skipped in a
+single step. Scan functions are skip functions that collect the pointers
+they pass over, along with their field paths; subtrees without any
+pointers in them are simply skipped.
+"""
+import struct
+from collections.abc import Mapping
+from . import engine as UnityEngine
+from .object import FFOrderedDict, ObjectPointer, load_object
+from .type import PRIMITIVE_FORMATS
+
+
+def _read_string(data, pos, size):
+	ret = data[pos:pos + size]
+	try:
+		# works for both bytes and memoryviews
+		return str(ret, "utf-8")
+	except UnicodeDecodeError:
+		return bytes(ret)
+
+
+def _resolve_streaming_asset(asset, path):
+	if len(path) > 0:
+		return asset.get_asset(path)
+
+
+def _import_numpy():
+	try:
+		import numpy
+	except ImportError:
+		raise RuntimeError("numpy is required to read arrays in numpy mode")
+	return numpy
+
+
+def array_dtype(type):
+	"""
+	NumPy dtype for the elements of an array of `type`, if it is a primitive
+	or a flat struct of primitives (see flat_format()). None otherwise.
+	"""
+	np = _import_numpy()
+
+	fmt = type.primitive_format
+	if fmt is not None:
+		if type.post_align or type.size > struct.calcsize("<" + fmt):
+			return None
+		return np.dtype("<" + fmt)
+
+	fmt = flat_format(type)
+	names = [child.name for child in type.children]
+	if fmt is None or len(set(names)) != len(names):
+		return None
+	return np.dtype([(name, "<" + c) for name, c in zip(names, fmt)])
+
+
+def flat_format(type):
+	"""
+	struct format of a struct-like type made of nothing but a single
+	unaligned run of primitives (Vector3f, XDT rows, ...), None otherwise.
+	"""
+	t = type.type
+	if not type.children or type.is_array or type.children[0].is_array or type.post_align:
+		return None
+	if t.startswith("PPtr<") or t in ("string", "pair", "StreamedResource", "StreamingInfo"):
+		return None
+
+	runs = type.primitive_runs()
+	if len(runs) != 1:
+		return None
+	fmt, children = runs[0]
+	if fmt is None or children[-1].post_align:
+		return None
+	if type.size > struct.calcsize("<" + fmt):
+		return None
+	return fmt
+
+
+class DecoderCompiler:
+	"""
+	Generates decoder functions for the TypeTrees of a single asset.
+
+	Every generated function has the signature `f(data, pos, base)` and
+	returns a `(value, pos)` tuple, where `data` is the raw object data
+	(bytes or a memoryview), `pos` the offset to start reading from and
+	`base` the absolute offset of `data` in the asset file (used for
+	FFOrderedDict offsets).
+	"""
+
+	def __init__(self, asset, numpy=False):
+		self.asset = asset
+		self.numpy = numpy
+		self.namespace = {
+			"asset": asset,
+			"FFOrderedDict": FFOrderedDict,
+			"ObjectPointer": ObjectPointer,
+			"_read_string": _read_string,
+			"_unpack_from": struct.unpack_from,
+			"_resolve_streaming_asset": _resolve_streaming_asset,
+		}
+		self.functions = {}
+		self.skippers = {}
+		self.scanners = {}
+		self.static_sizes = {}
+		self.pointer_types = {}
+		self.sources = []
+		self.counter = 0
+
+		if numpy:
+			self.namespace["_frombuffer"] = _import_numpy().frombuffer
+
+	def name(self, prefix):
+		self.counter += 1
+		return "_%s%i" % (prefix, self.counter)
+
+	def const(self, value, prefix="c"):
+		name = self.name(prefix)
+		self.namespace[name] = value
+		return name
+
+	def struct(self, fmt):
+		name = "_struct_" + fmt.replace("?", "bool")
+		if name not in self.namespace:
+			self.namespace[name] = struct.Struct("<" + fmt)
+		return name
+
+	@property
+	def pointer_format(self):
+		if self.asset.format == 7:
+			return "iI"
+		elif self.asset.format >= 14:
+			return "iq"
+		return "ii"
+
+	def flush(self):
+		if self.sources:
+			source = "\n\n".join(self.sources)
+			self.sources = []
+			exec(compile(source, "<decoder %r>" % (self.asset), "exec"), self.namespace)
+
+	def compile(self, type):
+		"Return the decoder function for `type`, generating it if necessary"
+		name = self.function(type)
+		self.flush()
+		return self.namespace[name]
+
+	def compile_skipper(self, type):
+		"Return the skip function `f(data, pos) -> pos` for `type`"
+		name = self.skipper(type)
+		self.flush()
+		return self.namespace[name]
+
+	def compile_scanner(self, type):
+		"""
+		Return the scan function `f(data, pos, out, path) -> pos` for `type`,
+		which appends a (field_path, file_id, path_id) tuple to `out` for every
+		non-null pointer. Field paths are appended to `path` as ".name" for
+		fields and "[i]" for array items.
+		"""
+		name = self.scanner(type)
+		self.flush()
+		return self.namespace[name]
+
+	def function(self, type):
+		if id(type) in self.functions:
+			return self.functions[id(type)]
+
+		name = self.name("read")
+		self.functions[id(type)] = name
+		lines = ["def %s(data, pos, base):" % (name)]
+		self.emit(type, "value", lines, "\t")
+		lines.append("\treturn value, pos")
+		self.sources.append("\n".join(lines))
+		return name
+
+	def skipper(self, type):
+		if id(type) in self.skippers:
+			return self.skippers[id(type)]
+
+		name = self.name("skip")
+		self.skippers[id(type)] = name
+		lines = ["def %s(data, pos):" % (name)]
+		self.emit_skip(type, lines, "\t")
+		lines.append("\treturn pos")
+		self.sources.append("\n".join(lines))
+		return name
+
+	def scanner(self, type):
+		if id(type) in self.scanners:
+			return self.scanners[id(type)]
+
+		name = self.name("scan")
+		self.scanners[id(type)] = name
+		lines = ["def %s(data, pos, out, path):" % (name)]
+		self.emit_scan(type, lines, "\t", "path", "")
+		lines.append("\treturn pos")
+		self.sources.append("\n".join(lines))
+		return name
+
+	def has_pointers(self, type):
+		"Whether values of `type` can contain pointers"
+		if id(type) not in self.pointer_types:
+			self.pointer_types[id(type)] = type.type.startswith("PPtr<") or any(
+				self.has_pointers(child) for child in type.children
+			)
+		return self.pointer_types[id(type)]
+
+	def static_size(self, type):
+		"""
+		Number of bytes `type` always reads, or None if it depends on the data.
+		This is the skip size of fixed-size subtrees.
+		"""
+		if id(type) not in self.static_sizes:
+			self.static_sizes[id(type)] = self._static_size(type)
+		return self.static_sizes[id(type)]
+
+	def _static_size(self, type):
+		t = type.type
+		if t in PRIMITIVE_FORMATS:
+			return struct.calcsize("<" + PRIMITIVE_FORMATS[t])
+		if t.startswith("PPtr<"):
+			return struct.calcsize("<" + self.pointer_format)
+		if t == "string" or type.is_array or not type.children or type.children[0].is_array:
+			return None
+
+		size = 0
+		for child in type.children:
+			child_size = self.static_size(child)
+			if child_size is None or child.post_align:
+				return None
+			size += child_size
+		return size
+
+	def emit_skip(self, type, lines, ind):
+		"Emit code advancing `pos` past a value of `type` without decoding it"
+		align = False
+		static_size = self.static_size(type)
+
+		if static_size is not None:
+			if static_size:
+				lines.append("%spos += %i" % (ind, static_size))
+		elif type.type == "string":
+			size = self.name("size")
+			lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, size, self.struct("I")))
+			lines.append("%spos += 4 + %s" % (ind, size))
+			align = type.children[0].post_align
+		else:
+			first_child = type if type.is_array else (type.children[0] if type.children else None)
+			if first_child is not None and first_child.is_array:
+				align = first_child.post_align
+				self.emit_skip_array(first_child.children[1], lines, ind)
+			else:
+				for child in type.children:
+					self.emit_skip(child, lines, ind)
+
+		if align or type.post_align:
+			lines.append("%spos = (pos + 3) & -4" % (ind))
+
+	def emit_skip_array(self, array_type, lines, ind):
+		size = self.name("size")
+		lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, size, self.struct("I")))
+		lines.append("%spos += 4" % (ind))
+
+		if array_type.type in ("char", "UInt8"):
+			lines.append("%spos += %s" % (ind, size))
+			return
+
+		item_size = self.static_size(array_type)
+		if item_size is not None and not array_type.post_align:
+			lines.append("%spos += %s * %i" % (ind, size, item_size))
+			return
+
+		lines.append("%sfor _ in range(%s):" % (ind, size))
+		if array_type.type in PRIMITIVE_FORMATS or array_type.type == "string":
+			self.emit_skip(array_type, lines, ind + "\t")
+		else:
+			lines.append("%s\tpos = %s(data, pos)" % (ind, self.skipper(array_type)))
+
+	def emit_scan(self, type, lines, ind, path, suffix):
+		"""
+		Emit code advancing `pos` past a value of `type`, collecting its
+		pointers. The value's field path is the variable `path` + `suffix`.
+		"""
+		if not self.has_pointers(type):
+			self.emit_skip(type, lines, ind)
+			return
+
+		align = False
+		first_child = type if type.is_array else (type.children[0] if type.children else None)
+
+		if type.type.startswith("PPtr<"):
+			file_id, path_id = self.name("file_id"), self.name("path_id")
+			fmt = self.pointer_format
+			lines.append("%s%s, %s = %s.unpack_from(data, pos)" % (ind, file_id, path_id, self.struct(fmt)))
+			lines.append("%spos += %i" % (ind, struct.calcsize("<" + fmt)))
+			lines.append("%sif %s or %s:" % (ind, file_id, path_id))
+			lines.append("%s\tout.append((%s + %r, %s, %s))" % (ind, path, suffix, file_id, path_id))
+		elif first_child is not None and first_child.is_array:
+			align = first_child.post_align
+			array_type = first_child.children[1]
+			size, i, item_path = self.name("size"), self.name("i"), self.name("path")
+			lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, size, self.struct("I")))
+			lines.append("%spos += 4" % (ind))
+			lines.append("%sfor %s in range(%s):" % (ind, i, size))
+			lines.append("%s\t%s = %s + %r %% (%s)" % (ind, item_path, path, suffix + "[%i]", i))
+			if array_type.type.startswith("PPtr<"):
+				self.emit_scan(array_type, lines, ind + "\t", item_path, "")
+			else:
+				lines.append("%s\tpos = %s(data, pos, out, %s)" % (ind, self.scanner(array_type), item_path))
+		else:
+			for child in type.children:
+				self.emit_scan(child, lines, ind, path, suffix + "." + child.name)
+
+		if align or type.post_align:
+			lines.append("%spos = (pos + 3) & -4" % (ind))
+
+	def emit(self, type, target, lines, ind):
+		"Emit code reading a value of `type` at `pos` into the variable `target`"
+		t = type.type
+		align = False
+		check = None
+
+		if type.size > 0:
+			static_size = self.static_size(type)
+			if static_size is None:
+				check = self.name("start")
+				lines.append("%s%s = pos" % (ind, check))
+			elif static_size < type.size:
+				# read_value() would fail on this no matter the data
+				message = "Expected read_value(%r) to read %r bytes, but only read %r bytes" % (
+					type, type.size, static_size
+				)
+				lines.append("%sraise ValueError(%r)" % (ind, message))
+				return
+
+		if t in PRIMITIVE_FORMATS:
+			fmt = PRIMITIVE_FORMATS[t]
+			lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, target, self.struct(fmt)))
+			lines.append("%spos += %i" % (ind, struct.calcsize("<" + fmt)))
+		elif t == "string":
+			size = self.name("size")
+			lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, size, self.struct("I")))
+			lines.append("%s%s = _read_string(data, pos + 4, %s)" % (ind, target, size))
+			lines.append("%spos += 4 + %s" % (ind, size))
+			align = type.children[0].post_align
+		else:
+			first_child = type if type.is_array else (type.children[0] if type.children else None)
+
+			if t.startswith("PPtr<"):
+				self.emit_pointer(type, target, lines, ind)
+			elif first_child is not None and first_child.is_array:
+				align = first_child.post_align
+				self.emit_array(first_child.children[1], target, lines, ind)
+			elif t == "pair":
+				assert len(type.children) == 2
+				first, second = self.name("first"), self.name("second")
+				self.emit(type.children[0], first, lines, ind)
+				self.emit(type.children[1], second, lines, ind)
+				lines.append("%s%s = (%s, %s)" % (ind, target, first, second))
+			else:
+				self.emit_dict(type, target, lines, ind)
+
+		if check is not None:
+			message = self.const(
+				"Expected read_value(%r) to read %r bytes, but only read %%r bytes" % (type, type.size)
+			)
+			lines.append("%sif pos - %s < %i:" % (ind, check, type.size))
+			lines.append("%s\traise ValueError(%s %% (pos - %s))" % (ind, message, check))
+
+		if align or type.post_align:
+			lines.append("%spos = (pos + 3) & -4" % (ind))
+
+	def emit_pointer(self, type, target, lines, ind):
+		file_id, path_id = self.name("file_id"), self.name("path_id")
+		fmt = self.pointer_format
+		lines.append("%s%s, %s = %s.unpack_from(data, pos)" % (ind, file_id, path_id, self.struct(fmt)))
+		lines.append("%spos += %i" % (ind, struct.calcsize("<" + fmt)))
+		lines.append("%sif %s or %s:" % (ind, file_id, path_id))
+		lines.append("%s\t%s = ObjectPointer(%s, asset)" % (ind, target, self.const(type, "type")))
+		lines.append("%s\t%s.file_id = %s" % (ind, target, file_id))
+		lines.append("%s\t%s.path_id = %s" % (ind, target, path_id))
+		lines.append("%selse:" % (ind))
+		lines.append("%s\t%s = None" % (ind, target))
+
+	def emit_array(self, array_type, target, lines, ind):
+		size = self.name("size")
+		lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, size, self.struct("I")))
+		lines.append("%spos += 4" % (ind))
+
+		if array_type.type in ("char", "UInt8"):
+			lines.append("%s%s = data[pos:pos + %s]" % (ind, target, size))
+			lines.append("%spos += %s" % (ind, size))
+			return
+
+		if self.numpy:
+			dtype = array_dtype(array_type)
+			if dtype is not None:
+				# copied, so the result doesn't keep the object data alive
+				lines.append("%s%s = _frombuffer(data, %s, %s, pos).copy()" % (
+					ind, target, self.const(dtype, "dtype"), size
+				))
+				lines.append("%spos += %s * %i" % (ind, size, dtype.itemsize))
+				return
+
+		fmt = array_type.primitive_format
+		if fmt is not None and not array_type.post_align and array_type.size <= struct.calcsize("<" + fmt):
+			# the whole array in a single unpack
+			item_size = struct.calcsize("<" + fmt)
+			lines.append("%s%s = list(_unpack_from('<%%i%s' %% (%s), data, pos))" % (ind, target, fmt, size))
+			lines.append("%spos += %s * %i" % (ind, size, item_size))
+			return
+
+		fmt = flat_format(array_type)
+		if fmt is not None:
+			self.emit_flat_array(array_type, fmt, size, target, lines, ind)
+			return
+
+		item = self.name("item")
+		lines.append("%s%s = []" % (ind, target))
+		lines.append("%sfor _ in range(%s):" % (ind, size))
+		if array_type.type in PRIMITIVE_FORMATS or array_type.type == "string":
+			self.emit(array_type, item, lines, ind + "\t")
+		else:
+			func = self.function(array_type)
+			lines.append("%s\t%s, pos = %s(data, pos, base)" % (ind, item, func))
+		lines.append("%s\t%s.append(%s)" % (ind, target, item))
+
+	def emit_flat_array(self, type, fmt, size, target, lines, ind):
+		item_size = struct.calcsize("<" + fmt)
+		item, values, offset = self.name("item"), self.name("values"), self.name("offset")
+		lines.append("%s%s = []" % (ind, target))
+		lines.append("%s%s = pos + base" % (ind, offset))
+		lines.append("%sfor %s in %s.iter_unpack(data[pos:pos + %s * %i]):" % (
+			ind, values, self.struct(fmt), size, item_size
+		))
+		self.emit_run_dict(type, item, values, offset, lines, ind + "\t")
+		lines.append("%s\t%s.append(%s)" % (ind, target, item))
+		lines.append("%s\t%s += %i" % (ind, offset, item_size))
+		lines.append("%spos += %s * %i" % (ind, size, item_size))
+
+	def emit_run_dict(self, type, target, values, offset, lines, ind):
+		"Build the FFOrderedDict for a flat struct from its unpacked `values`"
+		lines.append("%s%s = FFOrderedDict(%s, asset)" % (ind, target, offset))
+		offsets = self.name("offsets")
+		lines.append("%s%s = %s.memboffsets" % (ind, offsets, target))
+		field_offset = 0
+		for child in type.children:
+			lines.append("%s%s[%r] = %s + %i" % (ind, offsets, child.name, offset, field_offset))
+			field_offset += struct.calcsize("<" + child.primitive_format)
+		lines.append("%s%s = %s" % (ind, ", ".join("%s[%r]" % (target, c.name) for c in type.children) + ",", values))
+		if hasattr(UnityEngine, type.type):
+			cls = self.const(getattr(UnityEngine, type.type), "cls")
+			lines.append("%s%s = %s(%s)" % (ind, target, cls, target))
+
+	def emit_dict(self, type, target, lines, ind):
+		t = type.type
+		lines.append("%s%s = FFOrderedDict(pos + base, asset)" % (ind, target))
+		offsets = self.name("offsets")
+		lines.append("%s%s = %s.memboffsets" % (ind, offsets, target))
+
+		for fmt, children in type.primitive_runs():
+			if fmt is None:
+				child = children[0]
+				value = self.name("value")
+				lines.append("%s%s[%r] = pos + base" % (ind, offsets, child.name))
+				self.emit(child, value, lines, ind)
+				lines.append("%s%s[%r] = %s" % (ind, target, child.name, value))
+				continue
+
+			# a run of primitives, read with a single unpack
+			values = [self.name("value") for child in children]
+			lines.append("%s%s, = %s.unpack_from(data, pos)" % (ind, ", ".join(values), self.struct(fmt)))
+			field_offset = 0
+			for child, value in zip(children, values):
+				lines.append("%s%s[%r] = pos + base + %i" % (ind, offsets, child.name, field_offset))
+				lines.append("%s%s[%r] = %s" % (ind, target, child.name, value))
+				field_offset += struct.calcsize("<" + child.primitive_format)
+			lines.append("%spos += %i" % (ind, field_offset))
+			if children[-1].post_align:
+				lines.append("%spos = (pos + 3) & -4" % (ind))
+
+		if hasattr(UnityEngine, t):
+			cls = self.const(getattr(UnityEngine, t), "cls")
+			lines.append("%s%s = %s(%s)" % (ind, target, cls, target))
+		if t == "StreamedResource":
+			lines.append("%s%s.asset = _resolve_streaming_asset(asset, %s.source)" % (ind, target, target))
+		elif t == "StreamingInfo":
+			lines.append("%s%s.asset = _resolve_streaming_asset(asset, %s.path)" % (ind, target, target))
+
+
+def get_compiler(asset, numpy=False):
+	if numpy not in asset.compilers:
+		asset.compilers[numpy] = DecoderCompiler(asset, numpy)
+	return asset.compilers[numpy]
+
+
+def compile_decoder(type, asset, numpy=False):
+	"Return a decoder function `f(data, pos, base) -> (value, pos)` for `type`"
+	return get_compiler(asset, numpy).compile(type)
+
+
+def is_lazy_struct(type):
+	"Whether values of `type` are decoded as LazyOrderedDicts in lazy mode"
+	t = type.type
+	if not type.children or type.is_array or type.children[0].is_array:
+		return False
+	if t in PRIMITIVE_FORMATS or t.startswith("PPtr<"):
+		return False
+	return t not in ("string", "pair", "StreamedResource", "StreamingInfo")
+
+
+class LazyOrderedDict(Mapping):
+	"""
+	Read-through stand-in for the FFOrderedDict of a struct, which only
+	decodes each field when it is first accessed and caches it afterwards.
+	Fields that are structs themselves are returned as LazyOrderedDicts
+	as well. The offset of a field is found by skipping over the fields
+	before it, which is cheap for fixed-size fields.
+	"""
+
+	def __init__(self, type, data, pos, base, compiler):
+		self.type = type
+		self.offset = pos + base
+		self.asset = compiler.asset
+		self._data = data
+		self._base = base
+		self._compiler = compiler
+		self._names = [child.name for child in type.children]
+		self._indices = {name: i for i, name in enumerate(self._names)}
+		self._positions = [pos]
+		self._values = {}
+
+	def __repr__(self):
+		return "<%s %s (%i fields, %i decoded)>" % (
+			self.__class__.__name__, self.type.type, len(self._names), len(self._values)
+		)
+
+	def __len__(self):
+		return len(self._names)
+
+	def __iter__(self):
+		return iter(self._names)
+
+	def __contains__(self, name):
+		return name in self._indices
+
+	def __getitem__(self, name):
+		if name not in self._values:
+			index = self._indices[name]
+			child = self.type.children[index]
+			if not is_lazy_struct(child):
+				return self.decode(name)
+			pos = self._position(index)
+			value = LazyOrderedDict(child, self._data, pos, self._base, self._compiler)
+			self._values[name] = load_object(child, value)
+		return self._values[name]
+
+	def decode(self, name):
+		"Like self[name], but always decodes the field in full"
+		# decoded values may be None (null pointers), so check for the name
+		value = self._values.get(name)
+		if name not in self._values or isinstance(getattr(value, "_obj", value), LazyOrderedDict):
+			index = self._indices[name]
+			decoder = self._compiler.compile(self.type.children[index])
+			value = decoder(self._data, self._position(index), self._base)[0]
+			self._values[name] = value
+		return value
+
+	def __setitem__(self, name, value):
+		if name not in self._indices:
+			raise KeyError("%r is not a field of %r" % (name, self.type.type))
+		self._values[name] = value
+
+	def _position(self, index):
+		positions = self._positions
+		while len(positions) <= index:
+			i = len(positions) - 1
+			skip = self._compiler.compile_skipper(self.type.children[i])
+			positions.append(skip(self._data, positions[i]))
+		return positions[index]
+
+	@property
+	def memboffsets(self):
+		return {name: self.getmemboffset(name) for name in self._names}
+
+	def getmemboffset(self, name):
+		return self._position(self._indices[name]) + self._base
+
+	@property
+	def decoded(self):
+		"Names of the fields that have been decoded so far"
+		return list(self._values)
+
+
+def lazy_decode(type, asset, data, base, numpy=False):
+	"Decode `data` as a LazyOrderedDict of `type`, or fully if it isn't a struct"
+	compiler = get_compiler(asset, numpy)
+	if not is_lazy_struct(type):
+		return compiler.compile(type)(data, 0, base)[0]
+	return load_object(type, LazyOrderedDict(type, data, 0, base, compiler))
@@ -0,0 +1,167 @@
+"""
+Explicit traversal of GameObject hierarchies.
+
+Rather than following every pointer reachable from a GameObject, the
+HierarchyWalker only follows GameObject.m_Component, Transform.m_Children
+(back to each child's GameObject) and the m_Mesh of SkinnedMeshRenderers
+and MeshFilters. Only those fields are read from each object.
+
+Armatures are hierarchies of GameObjects as well. With prune_bones, every
+Transform listed in a SkinnedMeshRenderer's m_Bones is left out of the
+hierarchy along with everything under it, which gets rid of the helper
+meshes some models have attached to their bones.
+"""
+import logging
+
+
+FIELDS = {
+	"GameObject": ["m_Component"],
+	"Transform": ["m_GameObject", "m_Children"],
+	"SkinnedMeshRenderer": ["m_Mesh", "m_Bones"],
+	"MeshFilter": ["m_Mesh"],
+}
+
+
+def component_pointers(components):
+	"""
+	Pointers from the m_Component of a GameObject, which is made of either
+	(class_id, pointer) pairs or ComponentPair structs depending on version.
+	"""
+	ret = []
+	for ent in components:
+		ptr = ent[1] if isinstance(ent, tuple) else ent["component"]
+		if ptr is not None:
+			ret.append(ptr)
+	return ret
+
+
+class HierarchyNode:
+	def __init__(self, game_object, parent=None):
+		self.game_object = game_object
+		self.parent = parent
+		self.depth = 0 if parent is None else parent.depth + 1
+		self.transform = None
+		self.components = []
+		self.children = []
+
+	def __repr__(self):
+		return "<%s %r (path_id=%r, %i children)>" % (
+			self.__class__.__name__, self.name, self.game_object.path_id, len(self.children)
+		)
+
+	def __iter__(self):
+		"This node and all of its descendants, depth first"
+		yield self
+		for child in self.children:
+			yield from child
+
+	@property
+	def name(self):
+		return self.game_object.read_fields(["m_Name"]).get("m_Name", "")
+
+
+class HierarchyWalker:
+	"""
+	Builds HierarchyNode trees from GameObjects. The fields read from each
+	object are memoized per asset, so the parts that prefabs of the same
+	asset bundle share are only read once.
+	"""
+
+	def __init__(self):
+		self.memo = {}
+
+	def fields(self, obj):
+		"The fields of `obj` the traversal needs, by type"
+		memo = self.memo.setdefault(obj.asset, {})
+		if obj.path_id not in memo:
+			memo[obj.path_id] = obj.read_fields(FIELDS.get(str(obj.type), []))
+		return memo[obj.path_id]
+
+	def deref(self, ptr):
+		try:
+			return ptr.object
+		except (KeyError, IndexError) as e:
+			logging.warning("Could not resolve %r (%s)", ptr, e)
+			return None
+
+	def walk(self, game_object, prune_bones=False):
+		"""
+		Returns the root HierarchyNode of the hierarchy under `game_object`.
+		The hierarchy is walked one level at a time so the bones of
+		SkinnedMeshRenderers are known before their levels are expanded
+		where possible; anything that's found to be a bone later on is
+		pruned at the end.
+		"""
+		root = HierarchyNode(game_object)
+		seen = {game_object}
+		bones = set()
+		level = [root]
+
+		while level:
+			for node in level:
+				self.read_components(node, bones)
+
+			next_level = []
+			for node in level:
+				if node.transform is None or (prune_bones and node.transform in bones):
+					continue
+				for ptr in self.fields(node.transform).get("m_Children", []):
+					transform = ptr and self.deref(ptr)
+					if transform is None:
+						continue
+					go_ptr = self.fields(transform).get("m_GameObject")
+					child_go = go_ptr and self.deref(go_ptr)
+					if child_go is None or child_go in seen:
+						continue
+					seen.add(child_go)
+					child = HierarchyNode(child_go, node)
+					node.children.append(child)
+					next_level.append(child)
+			level = next_level
+
+		if prune_bones:
+			self.prune(root, bones)
+		return root
+
+	def read_components(self, node, bones):
+		for ptr in component_pointers(self.fields(node.game_object).get("m_Component", [])):
+			component = self.deref(ptr)
+			if component is None:
+				continue
+			node.components.append(component)
+
+			t = str(component.type)
+			if t == "Transform":
+				node.transform = component
+			elif t == "SkinnedMeshRenderer":
+				for bone in self.fields(component).get("m_Bones", []):
+					bone = bone and self.deref(bone)
+					if bone is not None:
+						bones.add(bone)
+
+	def prune(self, node, bones):
+		node.children = [child for child in node.children if child.transform not in bones]
+		for child in node.children:
+			self.prune(child, bones)
+
+	def find_meshes(self, game_object, prune_bones=True, mesh_filters=True):
+		"""
+		The Mesh objects used by the renderers in the hierarchy under
+		`game_object`, in hierarchy order and without duplicates.
+		SkinnedMeshRenderer meshes are always included, MeshFilter ones
+		only with mesh_filters.
+		"""
+		return self.meshes(self.walk(game_object, prune_bones), mesh_filters)
+
+	def meshes(self, root, mesh_filters=True):
+		"The Mesh objects used in the hierarchy of HierarchyNode `root`"
+		ret = []
+		for node in root:
+			for component in node.components:
+				t = str(component.type)
+				if t == "SkinnedMeshRenderer" or (mesh_filters and t == "MeshFilter"):
+					ptr = self.fields(component).get("m_Mesh")
+					mesh = ptr and self.deref(ptr)
+					if mesh is not None and mesh not in ret:
+						ret.append(mesh)
+		return ret
@@ -151,11 +151,12 @@ class Texture2D(Texture):
 
 	@property
 	def image_data(self):
-		if self.stream_data and self.stream_data.asset:
-			if not hasattr(self, "_data"):
-				self._data = self.stream_data.get_data()
-			return self._data
-		return self.data
+		if not hasattr(self, "_data"):
+			if not (self.stream_data and self.stream_data.asset):
+				return self.data
+			self._data = self.stream_data.get_data()
+		# also once the texture is detached from its asset (see unityextract)
+		return self._data
 
 	@property
 	def image(self):
@@ -2,22 +2,112 @@ import os
 from urllib.parse import urlparse
 from .asset import Asset
 from .assetbundle import AssetBundle
+from .filepool import FilePool
+from .metacache import MetadataCache
+from .objectcache import ObjectCache
 
 
 class UnityEnvironment:
-	def __init__(self, base_path=""):
+	def __init__(
+		self, base_path="", use_mmap=False, cache_dir=None, max_open_files=None,
+		max_cached_objects=None, max_cached_bytes=None
+	):
 		self.bundles = {}
 		self.assets = {}
 		self.base_path = base_path
-		self.files = []
+		self.use_mmap = use_mmap
+
+		# Files opened by the environment are closed (and reopened when
+		# needed again) so no more than max_open_files are open at once
+		self.file_pool = FilePool(max_open_files)
+		# bumped by reload() to invalidate resolved AssetRefs, and when
+		# objects are added to a loaded asset to invalidate path_id indexes
+		self.generation = 0
+		self._index = None
+		self._listings = {}
+
+		# Metadata of assets opened from files is cached in cache_dir
+		# (or $UNITYPACK_CACHE_DIR) if one is given
+		if cache_dir is None:
+			cache_dir = os.environ.get("UNITYPACK_CACHE_DIR")
+		self.metadata_cache = MetadataCache(cache_dir) if cache_dir else None
+
+		# Objects read from any asset of the environment are kept in an LRU
+		# cache if a budget is given (by count and/or estimated decoded size)
+		self.object_cache = ObjectCache(max_cached_objects, max_cached_bytes)
 
 	def __del__(self):
-		for f in self.files:
-			f.close()
+		self.file_pool.close()
 
 	def __repr__(self):
 		return "%s(base_path=%r)" % (self.__class__.__name__, self.base_path)
 
+	@property
+	def files(self):
+		return self.file_pool.files
+
+	def open_file(self, path):
+		return self.file_pool.open(path)
+
+	def refresh(self):
+		"""
+		Forget the indexed contents of base_path and of the directories
+		bundles were loaded from. Call this after files were added or renamed.
+		"""
+		self._index = None
+		self._listings.clear()
+
+	def _listdir(self, path):
+		try:
+			return os.listdir(path)
+		except OSError:
+			return []
+
+	def get_file_index(self):
+		"""
+		Returns a (top_level, nested) pair of dicts indexing base_path: the
+		names of its entries (as compared by the OS), and the lowercase names
+		of the entries of its subdirectories, both mapping to their path.
+		"""
+		if self._index is not None and self._index[0] == self.base_path:
+			return self._index[1]
+
+		top_level, nested = {}, {}
+		for d in self._listdir(self.base_path):
+			path = os.path.join(self.base_path, d)
+			top_level[os.path.normcase(d)] = path
+			if not os.path.isdir(path):
+				continue
+			for ent in self._listdir(path):
+				nested.setdefault(ent.lower(), os.path.join(path, ent))
+
+		self._index = (self.base_path, (top_level, nested))
+		return self._index[1]
+
+	def find_file(self, name):
+		"Path of the file `name` refers to in base_path, or None"
+		if os.path.dirname(name) or os.path.isabs(name):
+			path = os.path.join(self.base_path, name)
+			return path if os.path.exists(path) else None
+
+		top_level, nested = self.get_file_index()
+		if os.path.normcase(name) in top_level:
+			return top_level[os.path.normcase(name)]
+		# recurse one directory deep and search in there
+		return nested.get(name.lower())
+
+	def reload(self):
+		"""
+		Forget every loaded asset and bundle (and close their files) so
+		they're opened again from disk the next time they're needed.
+		"""
+		self.bundles = {}
+		self.assets = {}
+		self.object_cache.clear()
+		self.file_pool.close()
+		self.refresh()
+		self.generation += 1
+
 	def load(self, file):
 		for bundle in self.bundles.values():
 			if os.path.abspath(file.name) == os.path.abspath(bundle.path):
@@ -32,37 +122,27 @@ class UnityEnvironment:
 	def discover(self, name):
 		for bundle in list(self.bundles.values()):
 			dirname = os.path.dirname(os.path.abspath(bundle.path))
-			for filename in os.listdir(dirname):
-				basename = os.path.splitext(os.path.basename(filename))[0]
-				if name.lower() == "cab-" + basename.lower():
-					f = open(os.path.join(dirname, filename), "rb")
-					self.files.append(f)
-					self.load(f)
+			if dirname not in self._listings:
+				listing = {}
+				for filename in self._listdir(dirname):
+					basename = os.path.splitext(os.path.basename(filename))[0]
+					listing.setdefault("cab-" + basename.lower(), []).append(filename)
+				self._listings[dirname] = listing
+
+			for filename in self._listings[dirname].get(name.lower(), []):
+				self.load(self.open_file(os.path.join(dirname, filename)))
 
 	def get_asset_by_filename(self, name):
 		short = os.path.basename(name).lower()
 		if short in self.assets:
 			return self.assets[short]
 
-		path = os.path.join(self.base_path, name)
-		if os.path.exists(path):
-			f = open(path, "rb")
-			self.files.append(f)
-			self.assets[short] = Asset.from_file(f, environment=self)
+		path = self.find_file(name)
+		if path is not None:
+			f = self.open_file(path)
+			self.assets[short] = Asset.from_file(f, environment=self, use_mmap=self.use_mmap)
 			return self.assets[short]
 
-		# recurse one directory deep and search in there
-		for d in os.listdir(self.base_path):
-			if not os.path.isdir(os.path.join(self.base_path, d)):
-				continue
-
-			for ent in os.listdir(os.path.join(self.base_path, d)):
-				if ent.lower() == name.lower():
-					f = open(os.path.join(self.base_path, d, ent), "rb")
-					self.files.append(f)
-					self.assets[short] = Asset.from_file(f, environment=self)
-					return self.assets[short]
-
 		self.discover(name)
 		self.populate_assets()
 		if short in self.assets:
@@ -78,6 +158,33 @@ class UnityEnvironment:
 				if asset_name not in self.assets:
 					self.assets[asset_name] = asset
 
+	def iter_objects(self, types=None, names=None, decode=False):
+		"""
+		Asset.iter_objects() over every loaded asset (including those of
+		loaded bundles), one asset after the other.
+		"""
+		self.populate_assets()
+		seen = set()
+		for asset in list(self.assets.values()):
+			if id(asset) in seen or asset.is_resource:
+				continue
+			seen.add(id(asset))
+			yield from asset.iter_objects(types, names, decode)
+
+	def find_referrers(self, obj, types=None):
+		"""
+		The objects in any of the loaded assets (and obj's own) pointing to
+		`obj`, optionally only those of the given type names.
+		"""
+		ret = []
+		seen = set()
+		for asset in [obj.asset] + list(self.assets.values()):
+			if id(asset) in seen or asset.is_resource:
+				continue
+			seen.add(id(asset))
+			ret.extend(asset.references.referrers(obj, types))
+		return ret
+
 	def get_asset(self, url):
 		if not url:
 			return None
@@ -1,5 +1,56 @@
-from io import BytesIO
-from .utils import BinaryReader, BitReader
+import struct
+
+
+def _import_numpy():
+	try:
+		import numpy
+	except ImportError:
+		raise RuntimeError("numpy is required to export meshes")
+	return numpy
+
+
+def vector_array(vectors, fields):
+	"""
+	(n, len(fields)) float64 array of decoded vectors, which are either
+	dicts or a numpy record array (as read with numpy=True).
+	"""
+	np = _import_numpy()
+	if isinstance(vectors, np.ndarray) and vectors.dtype.names:
+		return np.column_stack([vectors[f].astype(np.float64) for f in fields]).reshape(-1, len(fields))
+	return np.array([[v[f] for f in fields] for v in vectors], dtype=np.float64).reshape(-1, len(fields))
+
+
+def unpack_bits(pbv):
+	"""
+	The m_NumItems integers of m_BitSize bits each packed (least significant
+	bit first) into the m_Data of a PackedBitVector, as a uint32 array.
+	Missing trailing bits read as zeros.
+	"""
+	np = _import_numpy()
+	count, size = pbv['m_NumItems'], pbv['m_BitSize']
+	if count == 0 or size == 0:
+		return np.zeros(0, dtype=np.uint32)
+
+	bits = np.unpackbits(np.frombuffer(bytes(pbv['m_Data']), dtype=np.uint8), bitorder="little")
+	if len(bits) < count * size:
+		bits = np.concatenate([bits, np.zeros(count * size - len(bits), dtype=np.uint8)])
+
+	# pad every item to 32 bits and pack them back into little endian words
+	items = np.zeros((count, 32), dtype=np.uint8)
+	items[:, :size] = bits[:count * size].reshape(count, size)
+	return np.packbits(items, axis=1, bitorder="little").view("<u4").reshape(count)
+
+
+def unpack_floats(pbv):
+	"The floats of a PackedBitVector, scaled into [m_Start, m_Start + m_Range]"
+	np = _import_numpy()
+	items = unpack_bits(pbv)
+	if len(items) == 0:
+		return np.zeros(0, dtype=np.float64)
+
+	maxvalue = (1 << pbv['m_BitSize']) - 1
+	_range = pbv['m_Range'] / maxvalue
+	return items.astype(np.float64) * _range + pbv['m_Start']
 
 
 class OBJVector2:
@@ -51,32 +102,38 @@ class OBJVector4(OBJVector3):
 		return "%s %s %s %s" % (self.x, self.y, self.z, self.w)
 
 
-def handle_strip_topology(mesh):
-	tris = []
-
-	for i in range(len(mesh.indices[0])):
-		tris.append(mesh.indices[0][i])
+def strip_to_triangles(strip):
+	"""
+	Flat triangle list for a triangle strip. Every other triangle has its
+	winding flipped, and degenerate triangles are left out.
+	"""
+	np = _import_numpy()
+	strip = np.asarray(strip, dtype=np.int64)
+	if len(strip) < 3:
+		return np.zeros(0, dtype=np.int64)
 
-		if len(tris) < 3:
-			continue
+	t1, t2, t3 = strip[:-2], strip[1:-1], strip[2:]
+	odd = np.arange(2, len(strip)) % 2 == 1
+	triangles = np.column_stack([np.where(odd, t3, t1), t2, np.where(odd, t1, t3)])
+	keep = (t1 != t2) & (t1 != t3) & (t2 != t3)
+	return triangles[keep].ravel()
 
-		t1 = tris[0]
-		t2 = tris[1]
-		t3 = tris[2]
 
-		del tris[0]
+def handle_strip_topology(mesh):
+	"Replace the triangles of every triangle strip submesh with its expanded strip"
+	for i, sub in enumerate(mesh.mesh.submeshes):
+		if i < len(mesh.indices) and sub.is_tri_strip > 0:
+			mesh.triangles[i] = strip_to_triangles(mesh.indices[i])
 
-		if t1 == t2 or t1 == t3 or t2 == t3:
-			continue
 
-		if i % 2 == 0:
-			mesh.triangles[0].append(t1)
-			mesh.triangles[0].append(t2)
-			mesh.triangles[0].append(t3)
-		else:
-			mesh.triangles[0].append(t3)
-			mesh.triangles[0].append(t2)
-			mesh.triangles[0].append(t1)
+# vertex channel format: (dtype, what to divide values by)
+CHANNEL_FORMATS = {
+	0: ("<f", None),
+	# half float
+	1: ("<e", None),
+	# UNorm8, for colors
+	2: ("<B", 255.0),
+}
 
 
 class MeshData:
@@ -94,93 +151,114 @@ class MeshData:
 		self.tangents = []
 
 		self.extract_indices()
-		self.simple_extract_vertices()
-
-		if len(self.mesh._obj['m_SubMeshes']) > 0:
-			if self.mesh._obj['m_SubMeshes'][0]._obj['isTriStrip'] > 0:
-				handle_strip_topology(self)
-
-		#if mesh.asset.format == 6:
-		#	self.simple_extract_vertices()
-		#else:
-		#	self.extract_vertices()
+		vertex_data = self.mesh._obj.get('m_VertexData')
+		if vertex_data is not None and vertex_data.vertex_count > 0 and not len(self.mesh._obj.get('m_Vertices', [])):
+			self.extract_vertices()
+		else:
+			self.simple_extract_vertices()
+		handle_strip_topology(self)
 
 	def simple_extract_vertices(self):
-		for v in self.mesh._obj['m_Vertices']:
-			self.vertices.append(OBJVector3(-v['x'], v['y'], v['z']))
+		self.vertices = vector_array(self.mesh._obj['m_Vertices'], "xyz")
+		self.vertices[:, 0] *= -1
 
-		for v in self.mesh._obj['m_Normals']:
-			self.normals.append(OBJVector3(-v['x'], v['y'], v['z']))
+		self.normals = vector_array(self.mesh._obj['m_Normals'], "xyz")
+		self.normals[:, 0] *= -1
 
-		for v in self.mesh._obj['m_UV']:
-			self.uv1.append(OBJVector2(v['x'], 1-v['y']))
+		self.uv1 = vector_array(self.mesh._obj['m_UV'], "xy")
+		self.uv1[:, 1] = 1 - self.uv1[:, 1]
 
 	def extract_indices(self):
-		for sub in self.mesh.submeshes:
-			sub_indices = []
-			sub_triangles = []
-			buf = BinaryReader(BytesIO(self.mesh.index_buffer))
-			buf.seek(sub.first_byte)
+		np = _import_numpy()
+		# indices are 16-bit unless the mesh says otherwise
+		dtype = np.dtype("<u2" if self.mesh._obj.get('m_Use16BitIndices', 1) else "<u4")
+		buf = np.frombuffer(bytes(self.mesh.index_buffer), dtype=np.uint8)
 
-			for i in range(0, sub.index_count):
-				sub_indices.append(buf.read_uint16())
+		for sub in self.mesh.submeshes:
+			end = sub.first_byte + sub.index_count * dtype.itemsize
+			if end > len(buf):
+				raise ValueError("%r: submesh indices end past the index buffer" % (self.mesh))
+			sub_indices = buf[sub.first_byte:end].view(dtype)
 
 			if sub._obj['isTriStrip'] == 0:
-				sub_triangles.extend(sub_indices)
+				sub_triangles = sub_indices
+			else:
+				sub_triangles = []
 
 			self.indices.append(sub_indices)
 			self.triangles.append(sub_triangles)
 
 	def extract_vertices(self):
+		"""
+		Read the vertices out of m_VertexData, with the same flips as
+		simple_extract_vertices(). Every channel is a strided view into
+		its stream, converted to float64 in one go.
+		"""
+		np = _import_numpy()
+		vertex_data = self.mesh.vertex_data
+		channels = vertex_data.channels
+		count = vertex_data.vertex_count
+		data = np.frombuffer(bytes(vertex_data.data), dtype=np.uint8)
+
 		# unity 5+ has 8 channels (6 otherwise)
 		v5_channel_count = 8
-		buf = BinaryReader(BytesIO(self.mesh.vertex_data.data))
-		channels = self.mesh.vertex_data.channels
-		# actual streams attribute 'm_Streams' may only exist in unity 4,
-		# use of channel data alone seems to be sufficient
-		stream_count = self.get_num_streams(channels)
-		channel_count = len(channels)
-
-		for s in range(0, stream_count):
-			for i in range(0, self.mesh.vertex_data.vertex_count):
-				for j in range(0, channel_count):
-					ch = None
-					if channel_count > 0:
-						ch = channels[j]
-						# format == 1, use half-floats (16 bit)
-						if ch["format"] == 1:
-							raise NotImplementedError("(%r) 16 bit floats are not supported" % (self.mesh))
-					# read the appropriate vertex value into the correct list
-					if ch and ch["dimension"] > 0 and ch["stream"] == s:
-						if j == 0:
-							self.vertices.append(OBJVector3().read(buf))
-						elif j == 1:
-							self.normals.append(OBJVector3().read(buf))
-						elif j == 2:
-							self.colors.append(OBJVector4().read_color(buf))
-						elif j == 3:
-							self.uv1.append(OBJVector2().read(buf))
-						elif j == 4:
-							self.uv2.append(OBJVector2().read(buf))
-						elif j == 5:
-							if channel_count == v5_channel_count:
-								self.uv3.append(OBJVector2().read(buf))
-							else:
-								self.tangents.append(OBJVector4().read(buf))
-						elif j == 6:  # for unity 5+
-							self.uv4.append(OBJVector2().read(buf))
-						elif j == 7:  # for unity 5+
-							self.tangents.append(OBJVector4().read(buf))
-			# TODO investigate possible alignment here, after each stream
-
-	def get_num_streams(self, channels):
-		streams = []
-		# scan the channel's stream value for distinct entries
-		for c in channels:
-			if c["stream"] not in streams:
-				streams.append(c["stream"])
-
-		return len(streams)
+		names = ["vertices", "normals", "colors", "uv1", "uv2"]
+		if len(channels) == v5_channel_count:
+			names += ["uv3", "uv4", "tangents"]
+		else:
+			names += ["tangents"]
+
+		streams = self.get_streams(channels)
+		for name, ch in zip(names, channels):
+			if ch["dimension"] == 0:
+				continue
+			if ch["format"] not in CHANNEL_FORMATS:
+				raise NotImplementedError("(%r) channel format %r is not supported" % (self.mesh, ch["format"]))
+
+			dtype, scale = CHANNEL_FORMATS[ch["format"]]
+			dtype = np.dtype(dtype)
+			offset, stride = streams[ch["stream"]]
+			shape = (count, ch["dimension"])
+			if count and offset + ch["offset"] + (count - 1) * stride + dtype.itemsize * ch["dimension"] > len(data):
+				raise ValueError("(%r) vertex stream %i ends past the vertex data" % (self.mesh, ch["stream"]))
+
+			values = np.ndarray(shape, dtype, data, offset + ch["offset"], (stride, dtype.itemsize)).astype(np.float64)
+			if scale is not None:
+				values /= scale
+			setattr(self, name, values)
+
+		if len(self.vertices):
+			self.vertices[:, 0] *= -1
+		if len(self.normals):
+			self.normals[:, 0] *= -1
+		for name in ("uv1", "uv2", "uv3", "uv4"):
+			uv = getattr(self, name)
+			if len(uv):
+				uv[:, 1] = 1 - uv[:, 1]
+
+	def get_streams(self, channels):
+		"""
+		(offset, stride) of each stream of the vertex data. Unless the mesh
+		lists its streams (Unity 4), a stream's stride is the size of its
+		channels, and streams follow each other aligned to 16 bytes.
+		"""
+		stream_infos = self.mesh.vertex_data._obj.get("m_Streams")
+		if stream_infos:
+			return {i: (stream["offset"], stream["stride"]) for i, stream in enumerate(stream_infos)}
+
+		strides = {}
+		for ch in channels:
+			if ch["dimension"] > 0 and ch["format"] in CHANNEL_FORMATS:
+				size = struct.calcsize(CHANNEL_FORMATS[ch["format"]][0]) * ch["dimension"]
+				strides[ch["stream"]] = strides.get(ch["stream"], 0) + size
+
+		ret = {}
+		offset = 0
+		for stream in sorted(strides):
+			ret[stream] = (offset, strides[stream])
+			offset += strides[stream] * self.mesh.vertex_data.vertex_count
+			offset = (offset + 15) & ~15
+		return ret
 
 class CompressedMeshData:
 	def __init__(self, mesh):
@@ -198,74 +276,36 @@ class CompressedMeshData:
 
 		self.extract_mesh()
 
-	def read_bits(self, pbv):
-		if pbv['m_NumItems'] == 0 or pbv['m_BitSize'] == 0:
-			return []
-
-		reader = BitReader(pbv['m_Data'], pbv['m_BitSize'])
-
-		ret = []
-		for i in range(pbv['m_NumItems']):
-			ret.append(reader.read())
-
-		return ret
-
-	def read_floats(self, pbv):
-		if pbv['m_NumItems'] == 0 or pbv['m_BitSize'] == 0:
-			return []
-
-		items = self.read_bits(pbv)
-		maxvalue = (1 << pbv['m_BitSize']) - 1
-		_range = pbv['m_Range'] / maxvalue
-
-		floats = []
-		for i in range(len(items)):
-			floats.append(float(items[i] * _range + pbv['m_Start']))
-
-		return floats
-
 	def read_normals(self, normals, normal_signs):
-		items = self.read_bits(normals)
-		signs = self.read_bits(normal_signs)
-
-		if len(items) == 0 or len(signs) == 0:
-			return []
-
-		for i in range(len(signs)):
-			if signs[i] == 0:
-				signs[i] = -1
-
-		maxvalue = (1 << normals['m_BitSize']) - 1
-		_range = normals['m_Range'] / maxvalue
-
-		floats = dict()
-		for i in range(len(signs)):
-			x = items[i * 2] * _range + normals['m_Start']
-			y = items[i * 2 + 1] * _range + normals['m_Start']
-			z = ((1 - x**2 - y**2) * signs[i])
-
-			floats[i * 3] = x
-			floats[i * 3 + 1] = y
-			floats[i * 3 + 2] = z
-
-		return list(floats.values())
+		np = _import_numpy()
+		signs = unpack_bits(normal_signs).astype(np.int64)
+		if len(signs) == 0:
+			return np.zeros((0, 3), dtype=np.float64)
+
+		items = unpack_floats(normals)
+		if len(items) == 0:
+			return np.zeros((0, 3), dtype=np.float64)
+
+		x = items[0:len(signs) * 2:2]
+		y = items[1:len(signs) * 2:2]
+		# float_power goes through libm's pow() like Python's x**2 does, which
+		# isn't always exactly x*x (what numpy's ** uses)
+		z = (1 - np.float_power(x, 2) - np.float_power(y, 2)) * np.where(signs == 0, -1, signs)
+		return np.column_stack([x, y, z])
 
 	def extract_mesh(self):
 		cmesh = self.mesh._obj['m_CompressedMesh']
 
-		vertex_floats = self.read_floats(cmesh['m_Vertices'])
-		for i in range(0, len(vertex_floats), 3):
-			self.vertices.append(OBJVector3(-vertex_floats[i], vertex_floats[i+1], vertex_floats[i+2]))
+		self.vertices = unpack_floats(cmesh['m_Vertices']).reshape(-1, 3)
+		self.vertices[:, 0] *= -1
 
-		normal_floats = self.read_normals(cmesh['m_Normals'], cmesh['m_NormalSigns'])
-		for i in range(0, len(normal_floats), 3):
-			self.normals.append(OBJVector3(-normal_floats[i], normal_floats[i+1], normal_floats[i+2]))
+		self.normals = self.read_normals(cmesh['m_Normals'], cmesh['m_NormalSigns'])
+		self.normals[:, 0] *= -1
 
-		uv_floats = self.read_floats(cmesh['m_UV'])
-		for i in range(0, len(uv_floats), 2):
-			self.uv1.append(OBJVector2(uv_floats[i], 1-uv_floats[i+1]))
+		self.uv1 = unpack_floats(cmesh['m_UV']).reshape(-1, 2)
+		self.uv1[:, 1] = 1 - self.uv1[:, 1]
 
-		triangle_ints = self.read_bits(cmesh['m_Triangles'])
+		triangle_ints = unpack_bits(cmesh['m_Triangles']).tolist()
 		if len(triangle_ints) % 3 == 2:
 			triangle_ints.append(triangle_ints[-1])
 		elif len(triangle_ints) % 3 == 1:
@@ -274,10 +314,7 @@ class CompressedMeshData:
 
 		self.triangles.append(triangle_ints)
 		self.indices.append(triangle_ints)
-
-		if len(self.mesh._obj['m_SubMeshes']) > 0:
-			if self.mesh._obj['m_SubMeshes'][0]._obj['isTriStrip'] > 0:
-				handle_strip_topology(self)
+		handle_strip_topology(self)
 
 
 class OBJMesh:
@@ -289,27 +326,43 @@ class OBJMesh:
 		self.mesh = mesh
 
 	@staticmethod
-	def face_str(indices, coords, normals):
-		ret = ["f "]
-		for i in indices[::-1]:
-			ret.append(str(i + 1))
-			if coords or normals:
-				ret.append("/")
-				if coords:
-					ret.append(str(i + 1))
-				if normals:
-					ret.append("/")
-					ret.append(str(i + 1))
-			ret.append(" ")
-		ret.append("\n")
-		return "".join(ret)
+	def format_rows(prefix, values):
+		"One line per row of the 2D array `values`, all formatted in one go"
+		if not len(values):
+			return ""
+		rows, cols = values.shape
+		row = prefix + " %r" * cols + "\n"
+		# tolist() gives Python floats, which format like they always have
+		return (row * rows) % tuple(values.ravel().tolist())
+
+	@staticmethod
+	def format_faces(triangles, coords, normals):
+		"""
+		The "f" lines for a flat array of triangle indices (a trailing
+		incomplete triangle is left out), with each face's winding reversed.
+		"""
+		np = _import_numpy()
+
+		count = len(triangles) // 3
+		faces = np.asarray(triangles, dtype=np.int64)[:count * 3].reshape(-1, 3)[:, ::-1] + 1
+
+		if coords and normals:
+			vertex, per_vertex = "%d/%d/%d ", 3
+		elif coords:
+			vertex, per_vertex = "%d/%d ", 2
+		elif normals:
+			vertex, per_vertex = "%d//%d ", 2
+		else:
+			vertex, per_vertex = "%d ", 1
+
+		row = "f " + vertex * 3 + "\n"
+		return (row * count) % tuple(np.repeat(faces.ravel(), per_vertex).tolist())
 
 	def export(self):
 		ret = []
-		verts_per_face = 3
 		normals = self.mesh_data.normals
 		tex_coords = self.mesh_data.uv1
-		if not tex_coords:
+		if not len(tex_coords):
 			tex_coords = self.mesh_data.uv2
 
 		# for debugging purposes
@@ -318,12 +371,9 @@ class OBJMesh:
 		else:
 			ret.append('# from uncompressed mesh\n\n')
 
-		for v in self.mesh_data.vertices:
-			ret.append("v %s\n" % (v))
-		for v in normals:
-			ret.append("vn %s\n" % (v))
-		for v in tex_coords:
-			ret.append("vt %s\n" % (v))
+		ret.append(self.format_rows("v", self.mesh_data.vertices))
+		ret.append(self.format_rows("vn", normals))
+		ret.append(self.format_rows("vt", tex_coords))
 		ret.append("\n")
 
 		# write group name and set smoothing to 1
@@ -336,12 +386,7 @@ class OBJMesh:
 				ret.append("usemtl %s\n" % (self.mesh.name))
 			else:
 				ret.append("usemtl %s_%d\n" % (self.mesh.name, i))
-			face_tri = []
-			for t in self.mesh_data.triangles[i]:
-				face_tri.append(t)
-				if len(face_tri) == verts_per_face:
-					ret.append(self.face_str(face_tri, tex_coords, normals))
-					face_tri = []
+			ret.append(self.format_faces(self.mesh_data.triangles[i], len(tex_coords) > 0, len(normals) > 0))
 			ret.append("\n")
 
 		return "".join(ret)
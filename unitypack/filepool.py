@@ -0,0 +1,144 @@
+"""
+A bounded pool of open file handles.
+
+Walking a whole cache directory opens hundreds of asset bundles, and each
+of them stays referenced by the UnityEnvironment that resolves pointers
+into it. FilePool hands out PooledFile objects that behave like regular
+files, but only keep up to max_open_files of them actually open. The least
+recently used ones are closed and transparently reopened (at the same
+position) the next time they're read.
+"""
+import logging
+import mmap
+from collections import OrderedDict
+
+
+class PooledFile:
+	def __init__(self, pool, name, mode="rb"):
+		self.pool = pool
+		self.name = name
+		self.mode = mode
+		self.closed = False
+		self._file = None
+		self._mmap = None
+		self._view = None
+		self._pos = 0
+
+	def __repr__(self):
+		return "<%s %r (%s)>" % (
+			self.__class__.__name__, self.name, "open" if self.is_open else "closed"
+		)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	@property
+	def is_open(self):
+		return self._file is not None
+
+	@property
+	def file(self):
+		"The underlying file object, reopened if it was closed by the pool"
+		if self.closed:
+			raise ValueError("I/O operation on closed file %r" % (self.name))
+		if self._file is None:
+			self._file = open(self.name, self.mode)
+			self._file.seek(self._pos)
+			self.pool.opened(self)
+		else:
+			self.pool.touch(self)
+		return self._file
+
+	@property
+	def view(self):
+		"A memoryview of the whole file, memory-mapped on first access"
+		if self._view is None:
+			f = self.file
+			self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			self._view = memoryview(self._mmap)
+		else:
+			self.file
+		return self._view
+
+	def read(self, size=-1):
+		return self.file.read(size)
+
+	def seek(self, offset, whence=0):
+		return self.file.seek(offset, whence)
+
+	def tell(self):
+		return self.file.tell()
+
+	def fileno(self):
+		return self.file.fileno()
+
+	def release(self):
+		"Close the underlying file (and mapping), remembering the position"
+		if self._view is not None:
+			try:
+				self._view.release()
+				self._mmap.close()
+			except BufferError:
+				# Objects decoded from the mapping still reference it, it'll
+				# be unmapped once they're gone.
+				logging.debug("%r is still referenced, not unmapping it", self)
+			self._view = None
+			self._mmap = None
+
+		if self._file is not None:
+			self._pos = self._file.tell()
+			self._file.close()
+			self._file = None
+
+	def close(self):
+		self.release()
+		self.pool.discard(self)
+		self.closed = True
+
+
+class FilePool:
+	"""
+	Keeps at most `max_open_files` PooledFiles open at once (unlimited if
+	None). Mapped files count as one handle.
+	"""
+
+	def __init__(self, max_open_files=None):
+		self.max_open_files = max_open_files
+		self.files = []
+		self._open = OrderedDict()
+
+	def __repr__(self):
+		return "<%s %i/%r open>" % (self.__class__.__name__, self.num_open, self.max_open_files)
+
+	@property
+	def num_open(self):
+		return len(self._open)
+
+	def open(self, name, mode="rb"):
+		ret = PooledFile(self, name, mode)
+		ret.file  # open it right away so errors surface here
+		self.files.append(ret)
+		return ret
+
+	def opened(self, f):
+		self._open[f] = None
+		if self.max_open_files is not None:
+			while len(self._open) > self.max_open_files:
+				lru, _ = self._open.popitem(last=False)
+				lru.release()
+
+	def touch(self, f):
+		if f in self._open:
+			self._open.move_to_end(f)
+
+	def discard(self, f):
+		self._open.pop(f, None)
+		if f in self.files:
+			self.files.remove(f)
+
+	def close(self):
+		for f in list(self.files):
+			f.close()
@@ -0,0 +1,98 @@
+"""
+Manifest of the files extracted into an output directory.
+
+Each extracted container path is recorded along with the bundle and path_id
+of its object, a hash of the object's serialized bytes and the hashes of
+every other object that went into the output (the Meshes and Transforms
+under a GameObject, the Texture2D of a Material...). When extracting again
+after a patch, an entry whose hashes all still match (and whose outputs all
+still exist) doesn't need to be decoded at all.
+"""
+import hashlib
+import json
+import logging
+import os
+
+
+FILENAME = ".manifest.json"
+
+
+def hash_object(obj):
+	"Hash of the serialized data of `obj`, which doesn't require decoding it"
+	return hashlib.sha1(obj.read_raw()).hexdigest()
+
+
+class Manifest:
+	"""
+	entries maps container paths to dicts with the following keys:
+	- bundle: the asset bundle the path was extracted from
+	- path_id, hash: the object at that path and the hash of its data
+	- sources: [asset name, path_id, hash] of every other object used
+	- outputs: the written files, relative to the output directory
+	"""
+
+	def __init__(self, outdir):
+		self.outdir = outdir
+		self.path = os.path.join(outdir, FILENAME)
+		self.entries = {}
+
+	def __repr__(self):
+		return "<%s %r (%i entries)>" % (self.__class__.__name__, self.path, len(self.entries))
+
+	def load(self):
+		try:
+			with open(self.path, "r") as f:
+				self.entries = json.load(f)
+		except FileNotFoundError:
+			self.entries = {}
+		except ValueError as e:
+			logging.warning("Ignoring unreadable manifest %r (%s)", self.path, e)
+			self.entries = {}
+
+	def save(self):
+		os.makedirs(self.outdir, exist_ok=True)
+		tmp = self.path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump(self.entries, f, indent="\t", sort_keys=True)
+		os.replace(tmp, self.path)
+
+	def update_bundle(self, bundle, entries):
+		"Replace every entry extracted from `bundle` with `entries`"
+		for path in [path for path, entry in self.entries.items() if entry["bundle"] == bundle]:
+			del self.entries[path]
+		self.entries.update(entries)
+
+	@staticmethod
+	def make_entry(bundle, obj, sources, outputs):
+		return {
+			"bundle": bundle,
+			"path_id": obj.path_id,
+			"hash": hash_object(obj),
+			"sources": [
+				[os.path.basename(src.asset.name), src.path_id, hash_object(src)]
+				for src in sources if src is not obj
+			],
+			"outputs": outputs,
+		}
+
+	def is_current(self, path, bundle, obj, environment):
+		"""
+		Whether the outputs for container path `path` (`obj`, in `bundle`)
+		are up to date. Source objects in other assets are looked up
+		through `environment`.
+		"""
+		entry = self.entries.get(path)
+		if entry is None or entry["bundle"] != bundle or entry["path_id"] != obj.path_id:
+			return False
+		if entry["hash"] != hash_object(obj):
+			return False
+
+		for name, path_id, digest in entry["sources"]:
+			try:
+				src = environment.get_asset_by_filename(name).objects[path_id]
+			except KeyError:
+				return False
+			if hash_object(src) != digest:
+				return False
+
+		return all(os.path.exists(os.path.join(self.outdir, output)) for output in entry["outputs"])
@@ -0,0 +1,144 @@
+"""
+On-disk cache of parsed asset metadata.
+
+Parsing the type trees and object tables of every asset on every run adds
+up when a tool walks thousands of asset bundles. MetadataCache stores what
+Asset.load() parses (header, TypeMetadata, object table, adds and asset
+refs) and hands it back as long as the file hasn't changed.
+"""
+import hashlib
+import logging
+import os
+import pickle
+
+
+CACHE_VERSION = 1
+
+HEADER_FIELDS = (
+	"metadata_size", "file_size", "format", "data_offset", "endianness", "long_object_ids"
+)
+
+OBJECT_FIELDS = (
+	"path_id", "data_offset", "size", "type_id", "class_id", "is_destroyed", "unk0", "unk1"
+)
+
+
+def content_hash(path):
+	h = hashlib.sha1()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class MetadataCache:
+	"""
+	A directory of cached asset metadata, keyed by file path, size and
+	modification time. With verify_hash, a hash of the file contents has
+	to match as well.
+	"""
+
+	def __init__(self, path, verify_hash=False):
+		self.path = path
+		self.verify_hash = verify_hash
+		os.makedirs(path, exist_ok=True)
+
+	def __repr__(self):
+		return "%s(%r)" % (self.__class__.__name__, self.path)
+
+	def get_path(self, asset, suffix=".meta"):
+		name = hashlib.sha1(asset.path.encode("utf-8")).hexdigest()
+		return os.path.join(self.path, name + suffix)
+
+	def get_key(self, asset):
+		st = os.stat(asset.path)
+		return (CACHE_VERSION, asset.path, asset._buf_ofs, st.st_size, st.st_mtime_ns)
+
+	def read(self, asset, suffix=".meta"):
+		"Return the payload stored for `asset` under `suffix`, if still current"
+		path = self.get_path(asset, suffix)
+		if not os.path.exists(path):
+			return None
+
+		try:
+			with open(path, "rb") as f:
+				key, hash, payload = pickle.load(f)
+		except Exception as e:
+			logging.warning("Ignoring unreadable metadata cache %r (%s)", path, e)
+			return None
+
+		if key != self.get_key(asset):
+			return None
+		if self.verify_hash and hash != content_hash(asset.path):
+			return None
+		return payload
+
+	def write(self, asset, payload, suffix=".meta"):
+		"Store `payload` for `asset` under `suffix`"
+		path = self.get_path(asset, suffix)
+		hash = content_hash(asset.path) if self.verify_hash else None
+		tmp = path + ".tmp"
+		with open(tmp, "wb") as f:
+			pickle.dump((self.get_key(asset), hash, payload), f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp, path)
+
+	def load(self, asset):
+		"Populate `asset` from the cache. Returns False if there's no usable entry."
+		from .asset import AssetRef
+		from .object import ObjectInfo
+
+		payload = self.read(asset)
+		if payload is None:
+			return False
+
+		header, tree, objects, adds, refs = payload
+
+		for name, value in zip(HEADER_FIELDS, header):
+			if value is not None:
+				setattr(asset, name, value)
+
+		(
+			asset.tree.generator_version, asset.tree.target_platform,
+			asset.tree.class_ids, asset.tree.hashes, asset.tree.type_trees
+		) = tree
+
+		for values in objects:
+			obj = ObjectInfo(asset)
+			for name, value in zip(OBJECT_FIELDS, values):
+				if value is not None:
+					setattr(obj, name, value)
+			asset.register_object(obj)
+
+		asset.adds = list(adds)
+
+		for asset_path, guid, type, file_path in refs:
+			ref = AssetRef(asset)
+			ref.asset_path = asset_path
+			ref.guid = guid
+			ref.type = type
+			ref.file_path = file_path
+			ref.asset = None
+			asset.asset_refs.append(ref)
+
+		return True
+
+	def store(self, asset):
+		"Store the metadata of a freshly loaded `asset`"
+		header = tuple(getattr(asset, name, None) for name in HEADER_FIELDS)
+		tree = (
+			asset.tree.generator_version, asset.tree.target_platform,
+			asset.tree.class_ids, asset.tree.hashes, asset.tree.type_trees
+		)
+		objects = [
+			tuple(getattr(obj, name, None) for name in OBJECT_FIELDS)
+			for obj in asset._objects.values()
+		]
+		refs = [
+			(ref.asset_path, ref.guid, ref.type, ref.file_path)
+			for ref in asset.asset_refs[1:]
+		]
+
+		try:
+			self.write(asset, (header, tree, objects, asset.adds, refs))
+		except OSError as e:
+			logging.warning("Could not write metadata cache for %r (%s)", asset, e)
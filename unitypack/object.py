@@ -1,5 +1,6 @@
 import logging
 from collections import OrderedDict
+from collections.abc import Mapping
 from io import BytesIO
 from . import engine as UnityEngine
 from .resources import UnityClass
@@ -43,7 +44,7 @@ class ObjectInfo:
 		if self.type_id > 0:
 			return UnityClass(self.type_id)
 		elif self.type_id not in self.asset.typenames:
-			script = self.read()["m_Script"]
+			script = self.read_fields(["m_Script"]).get("m_Script")
 			if script:
 				try:
 					typename = script.resolve()["m_ClassName"]
@@ -115,20 +116,131 @@ class ObjectInfo:
 			self._contents = self._read()
 		return self._contents
 
-	def read(self):
-		"Return object if memoized, otherwise read it from disk without memoizing it"
+	def read(self, compiled=True, numpy=False, lazy=False):
+		"""
+		Return object if memoized, otherwise read it from disk without memoizing it.
+		If the environment has an object cache, it's looked up there first and
+		stored there afterwards (except for compiled=False reads).
+		"""
 
-		if self._contents is None:
-			return self._read()
-		return self._contents
+		if self._contents is not None:
+			return self._contents
+
+		cache = self.object_cache
+		if cache is None or not compiled:
+			return self._read(compiled, numpy, lazy)
 
-	def _read(self):
-		"Read object without memoizing it"
+		ret = cache.get(self, (numpy, lazy))
+		if ret is None:
+			ret = self._read(compiled, numpy, lazy)
+			cache.put(self, (numpy, lazy), ret)
+		return ret
+
+	@property
+	def object_cache(self):
+		"The environment's ObjectCache, if it has an enabled one"
+		environment = self.asset.environment
+		cache = getattr(environment, "object_cache", None)
+		if cache is not None and cache.enabled:
+			return cache
+		return None
+
+	def get_decoder(self, numpy=False):
+		"Compiled decoder for this object's type. Cached per asset and type_id."
+
+		decoders = self.asset.decoders
+		key = (self.type_id, numpy)
+		if key not in decoders:
+			from .decoder import compile_decoder
+			decoders[key] = compile_decoder(self.type_tree, self.asset, numpy)
+		return decoders[key]
+
+	def _read(self, compiled=True, numpy=False, lazy=False):
+		"""
+		Read object without memoizing it.
+		Pass compiled=False to decode it with read_value() instead of the
+		compiled decoder; both are expected to return identical results.
+		With numpy=True, arrays of primitives and of flat structs of
+		primitives are returned as NumPy arrays instead of lists.
+		With lazy=True, a LazyOrderedDict is returned in place of the
+		FFOrderedDict, which only decodes fields as they are accessed.
+		"""
+
+		object_buf = self.read_raw()
+		base = self.asset._buf_ofs + self.data_offset
+		if not compiled:
+			if numpy or lazy:
+				raise ValueError("numpy and lazy modes require the compiled decoder")
+			return self.read_value(self.type_tree, BinaryReader(BytesIO(object_buf)))
+		if lazy:
+			from .decoder import lazy_decode
+			return lazy_decode(self.type_tree, self.asset, object_buf, base, numpy)
+		return self.get_decoder(numpy)(object_buf, 0, base)[0]
+
+	def read_fields(self, fields, numpy=False):
+		"""
+		Decode only the given fields of the object, skipping over the rest.
+		Fields are top-level names or dotted paths into nested structs
+		(eg. "m_Heightmap.m_Width").
+		Returns a dict of those of the requested fields the object has.
+		"""
+		from .decoder import LazyOrderedDict, lazy_decode
+
+		if self._contents is not None:
+			obj = self._contents
+		else:
+			base = self.asset._buf_ofs + self.data_offset
+			obj = lazy_decode(self.type_tree, self.asset, self.read_raw(), base, numpy)
+
+		ret = {}
+		for field in fields:
+			value = obj
+			names = field.split(".")
+			for i, name in enumerate(names, 1):
+				value = getattr(value, "_obj", value)
+				if not isinstance(value, Mapping) or name not in value:
+					break
+				if i == len(names) and isinstance(value, LazyOrderedDict):
+					value = value.decode(name)
+				else:
+					value = value[name]
+			else:
+				ret[field] = value
+		return ret
+
+	def scan_pointers(self):
+		"""
+		List the non-null pointers in the object without decoding it, as
+		(field_path, file_id, path_id) tuples in field order. Field paths look
+		like "m_Component[2].second" (pairs have first and second fields).
+		"""
+		from .decoder import get_compiler
+
+		scan = get_compiler(self.asset).compile_scanner(self.type_tree)
+		ret = []
+		scan(self.read_raw(), 0, ret, "")
+		return [(path[1:], file_id, path_id) for path, file_id, path_id in ret]
+
+	def get_pointers(self):
+		"Like scan_pointers(), but as (field_path, ObjectPointer) pairs"
+		ret = []
+		for path, file_id, path_id in self.scan_pointers():
+			ptr = ObjectPointer(None, self.asset)
+			ptr.file_id = file_id
+			ptr.path_id = path_id
+			ret.append((path, ptr))
+		return ret
+
+	def read_raw(self):
+		"Raw object data. A zero-copy memoryview if the asset is memory-mapped."
+
+		start = self.asset._buf_ofs + self.data_offset
+		if self.asset._view is not None:
+			return self.asset._view[start:start + self.size]
 
 		buf = self.asset._buf
-		buf.seek(self.asset._buf_ofs + self.data_offset)
-		object_buf = buf.read(self.size)
-		return self.read_value(self.type_tree, BinaryReader(BytesIO(object_buf)))
+		buf.seek(start)
+		return buf.read(self.size)
 
 	def read_value(self, type, buf):
 		align = False
@@ -295,6 +407,10 @@ class ObjectInfo:
 				if array_type.type in ("char", "UInt8"):
 					# ASCII, not UTF-8
 					buf.write(content)
+				elif hasattr(content, "dtype"):
+					# NumPy array from a numpy mode read()
+					from .decoder import array_dtype
+					buf.write(content.astype(array_dtype(array_type), copy=False).tobytes())
 				else:
 					for memb in content:
 						self.write_value(array_type, buf, memb)
@@ -375,21 +491,10 @@ class ObjectPointer:
 
 	@property
 	def asset(self):
-		from .asset import AssetRef
-
 		if self.source_asset.format == 7:
-			for ref in self.source_asset.asset_refs:
-				asset = ref.resolve() if isinstance(ref, AssetRef) else ref
-
-				if self.path_id in asset.objects.keys():
-					return asset
-
-			raise KeyError('path_id {} not found in asset_refs'.format(self.path_id))
+			return self.source_asset.get_path_id_owner(self.path_id)
 		else:
-			ret = self.source_asset.asset_refs[self.file_id]
-			if isinstance(ret, AssetRef):
-				ret = ret.resolve()
-			return ret
+			return self.source_asset.get_ref_asset(self.file_id)
 
 	@property
 	def object(self):
@@ -0,0 +1,125 @@
+"""
+Environment-wide cache of decoded objects.
+
+ObjectInfo.read() decodes an object from scratch every time, which adds up
+when the same Materials and GameObjects are reached over and over through
+ObjectPointer.resolve(). An ObjectCache keeps the most recently decoded
+objects around, evicting the least recently used ones once it holds more
+than max_objects objects or takes up more than max_bytes bytes.
+
+The bytes are an estimate of the memory the decoded objects take, which
+is a lot more than their serialized size: decoded as lists of dicts of
+floats, arrays of vectors take ~80 times as much. See decoded_size().
+"""
+import sys
+from collections import OrderedDict
+from .engine.object import Object
+
+
+def decoded_size(value):
+	"""
+	Rough estimate of the memory taken by a decoded object: the sizes of
+	the dicts, lists, strings and numbers (and numpy arrays) it's made of.
+	Anything else (ObjectPointers, lazily decoded structs) is counted
+	shallowly.
+	"""
+	size = 0
+	stack = [value]
+	while stack:
+		v = stack.pop()
+		size += sys.getsizeof(v)
+		t = type(v)
+		if t is list or t is tuple:
+			stack.extend(v)
+		elif isinstance(v, dict):
+			# keys are the same few field names over and over
+			stack.extend(v.values())
+			memboffsets = getattr(v, "memboffsets", None)
+			if memboffsets:
+				stack.append(memboffsets)
+		elif isinstance(v, Object):
+			stack.append(v._obj)
+	return size
+
+
+class ObjectCache:
+	"""
+	LRU cache of decoded objects keyed by (asset, path_id, variant).
+	It is disabled unless at least one budget is given. max_bytes is
+	compared against the estimated decoded size of the objects, not their
+	serialized size, and an object estimated larger than it isn't cached.
+
+	Cached objects are shared between everyone that reads them, so they
+	mustn't be modified. Use ObjectInfo.contents for objects that will be.
+	"""
+
+	def __init__(self, max_objects=None, max_bytes=None):
+		self.max_objects = max_objects
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.size = 0
+		self._entries = OrderedDict()
+
+	def __repr__(self):
+		return "<%s %i objects, %i bytes (%i hits, %i misses)>" % (
+			self.__class__.__name__, len(self), self.size, self.hits, self.misses
+		)
+
+	def __len__(self):
+		return len(self._entries)
+
+	@property
+	def enabled(self):
+		return self.max_objects is not None or self.max_bytes is not None
+
+	def get(self, obj, variant):
+		"Return the cached decoding of `obj`, or None"
+		key = (obj.asset, obj.epath_id, variant)
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		self._entries.move_to_end(key)
+		return entry[0]
+
+	def put(self, obj, variant, value):
+		key = (obj.asset, obj.epath_id, variant)
+		if key in self._entries:
+			self.size -= self._entries.pop(key)[1]
+
+		if self.max_bytes is None:
+			size = obj.size
+		else:
+			# objects that would take up the whole budget aren't kept at all
+			if obj.size > self.max_bytes:
+				return
+			# lazily decoded objects hold on to their serialized data
+			size = max(obj.size, decoded_size(value))
+			if size > self.max_bytes:
+				return
+
+		self._entries[key] = (value, size)
+		self.size += size
+		self.evict()
+
+	def evict(self):
+		while self._entries and (
+			(self.max_objects is not None and len(self._entries) > self.max_objects) or
+			(self.max_bytes is not None and self.size > self.max_bytes)
+		):
+			_, (_, size) = self._entries.popitem(last=False)
+			self.size -= size
+
+	def discard(self, asset):
+		"Drop every cached object of `asset`"
+		for key in [key for key in self._entries if key[0] is asset]:
+			self.size -= self._entries.pop(key)[1]
+
+	def clear(self):
+		self._entries.clear()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
@@ -0,0 +1,102 @@
+"""
+Forward and reverse pointer index of the objects in an asset.
+
+Finding out which objects point at a given object (before deleting it, or
+to find all Materials using a Texture2D) otherwise means decoding every
+object in every asset. AssetReferences scans each object of an asset once,
+only reading its pointers, and keeps the edges in both directions. The
+index is stored alongside the asset's cached metadata if the environment
+has a metadata cache.
+"""
+import logging
+import struct
+
+
+CACHE_SUFFIX = ".refs"
+
+
+class AssetReferences:
+	"""
+	forward maps the path_id of every object in the asset to the
+	(file_id, path_id) of each of its non-null pointers, in order.
+	reverse maps a pointed-to path_id to the (path_id, file_id) of each
+	pointer in this asset with that path_id. Like the keys of
+	Asset.objects, these are effective path_ids; which asset a pointer
+	points into is only known once it's resolved.
+	"""
+
+	def __init__(self, asset, forward):
+		self.asset = asset
+		self.forward = forward
+		self.reverse = {}
+		for source, pointers in forward.items():
+			for file_id, path_id in pointers:
+				self.reverse.setdefault(path_id, []).append((source, file_id))
+
+	def __repr__(self):
+		return "<%s %r (%i objects)>" % (self.__class__.__name__, self.asset, len(self.forward))
+
+	@classmethod
+	def load(cls, asset):
+		"The index of `asset`, from the metadata cache if it's current there"
+		cache = asset.metadata_cache
+		forward = cache.read(asset, CACHE_SUFFIX) if cache is not None else None
+		if forward is None:
+			forward = cls.scan(asset)
+			if cache is not None:
+				try:
+					cache.write(asset, forward, CACHE_SUFFIX)
+				except OSError as e:
+					logging.warning("Could not write reference index for %r (%s)", asset, e)
+		return cls(asset, forward)
+
+	@staticmethod
+	def scan(asset):
+		forward = {}
+		for path_id, obj in asset.objects.items():
+			if obj.type_tree is None:
+				continue
+			try:
+				forward[path_id] = [ptr[1:] for ptr in obj.scan_pointers()]
+			except struct.error as e:
+				logging.warning("Could not scan %r (path_id=%r) for pointers (%s)", obj, path_id, e)
+		return forward
+
+	def resolve(self, file_id, path_id):
+		"The Asset a (file_id, path_id) pointer in this asset points into"
+		if self.asset.format == 7:
+			return self.asset.get_path_id_owner(path_id)
+		return self.asset.get_ref_asset(file_id)
+
+	def dependencies(self, obj):
+		"The objects `obj` (an object of this asset) points to, in order"
+		ret = []
+		for file_id, path_id in self.forward.get(obj.epath_id, []):
+			ret.append(self.resolve(file_id, path_id).objects[path_id])
+		return ret
+
+	def referrers(self, obj, types=None):
+		"""
+		The objects in this asset pointing to `obj`, which may be in any
+		asset. `types` optionally restricts them to the given type names.
+		"""
+		if isinstance(types, str):
+			types = (types, )
+
+		# pointers to obj have its effective path_id, and resolve to its asset
+		path_id = obj.epath_id
+		ret = []
+		for source, file_id in self.reverse.get(path_id, []):
+			try:
+				if self.resolve(file_id, path_id) is not obj.asset:
+					continue
+			except (KeyError, IndexError):
+				# dangling pointer, or to an asset that isn't available
+				continue
+
+			referrer = self.asset.objects[source]
+			if types is not None and str(referrer.type) not in types:
+				continue
+			if referrer not in ret:
+				ret.append(referrer)
+		return ret
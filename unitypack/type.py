@@ -1,9 +1,28 @@
+import struct
 from io import BytesIO
 from .enums import RuntimePlatform
 from .resources import get_resource, STRINGS_DAT
 from .utils import BinaryReader
 
 
+# struct format characters for the primitive types read_value() understands
+PRIMITIVE_FORMATS = {
+	"bool": "?",
+	"SInt8": "b",
+	"UInt8": "B",
+	"SInt16": "h",
+	"UInt16": "H",
+	"SInt64": "q",
+	"UInt64": "q",  # read as signed, like read_value() always has
+	"UInt32": "I",
+	"unsigned int": "I",
+	"SInt32": "i",
+	"int": "i",
+	"float": "f",
+	"double": "d",
+}
+
+
 class TypeTree:
 	NULL = "(null)"
 
@@ -27,6 +46,40 @@ class TypeTree:
 	def post_align(self):
 		return bool(self.flags & 0x4000)
 
+	@property
+	def primitive_format(self):
+		"struct format character for primitive types, None otherwise"
+		return PRIMITIVE_FORMATS.get(self.type)
+
+	def primitive_runs(self):
+		"""
+		Split the children into runs of consecutive fixed-size primitives
+		that can be read with a single struct unpack. A run ends before any
+		child that isn't such a primitive and after any child that is
+		followed by alignment.
+		Returns a list of (format, children) tuples, where format is None for
+		children that have to be read on their own.
+		"""
+		ret = []
+		run = []
+		for child in self.children:
+			fmt = child.primitive_format
+			if fmt is None or child.size > struct.calcsize("<" + fmt):
+				if run:
+					ret.append(("".join(c.primitive_format for c in run), run))
+					run = []
+				ret.append((None, [child]))
+				continue
+
+			run.append(child)
+			if child.post_align:
+				ret.append(("".join(c.primitive_format for c in run), run))
+				run = []
+
+		if run:
+			ret.append(("".join(c.primitive_format for c in run), run))
+		return ret
+
 	def load(self, buf):
 		if self.format == 10 or self.format >= 12:
 			self.load_blob(buf)